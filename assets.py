@@ -0,0 +1,104 @@
+import pygame
+from utils import scale_image
+
+# Every image the game draws goes through this cache, so each file is read,
+# scaled and converted to the display format once per process.
+_IMAGES = {}
+_CONVERTED = set()
+_ROTATIONS = {}
+_FONTS = {}
+
+# Car sprites are pre-rotated in steps of this many degrees.
+ROTATION_STEP = 1
+
+
+def _display_format(image):
+    # Whether blitting the image to the window needs no pixel conversion,
+    # e.g. because it came from the asset bundle already in that format.
+    reference = pygame.Surface((1, 1), pygame.SRCALPHA).convert_alpha()
+    return (image.get_bitsize() == reference.get_bitsize()
+            and image.get_masks() == reference.get_masks())
+
+
+def load_image(path, factor=1):
+    key = (path, factor)
+    image = _IMAGES.get(key)
+
+    if image is None:
+        image = pygame.image.load(path)
+        if factor != 1:
+            image = scale_image(image, factor)
+        _IMAGES[key] = image
+
+    # Images loaded before the window exists can't be converted yet; they are
+    # converted on the first lookup after pygame.display.set_mode.
+    if key not in _CONVERTED and pygame.display.get_surface() is not None:
+        if not _display_format(image):
+            image = image.convert_alpha()
+            _IMAGES[key] = image
+        _CONVERTED.add(key)
+
+    return image
+
+
+def cache_image(path, factor, image):
+    # Hands load_image an image that was decoded and scaled elsewhere, e.g.
+    # from a track's preprocessed cache, unless it already has one.
+    _IMAGES.setdefault((path, factor), image)
+
+
+def has_image(path, factor=1):
+    return (path, factor) in _IMAGES
+
+
+class RotationCache:
+    def __init__(self, image, step=ROTATION_STEP, rotated=None):
+        self.step = step
+        self.count = round(360 / step)
+        rect = image.get_rect()
+        # Each frame holds the rotated sprite, the offset of its top left corner
+        # from the unrotated sprite's top left corner, and its collision mask.
+        # The rotated sprites can be passed in, e.g. from the asset bundle.
+        # Masks are made the first time a frame is used, as pygame can't make
+        # them over bundled data and a race only sees some of the angles.
+        self.frames = []
+        for i in range(self.count):
+            frame = rotated[i] if rotated else pygame.transform.rotate(image, i * step)
+            new_rect = frame.get_rect(center=rect.center)
+            self.frames.append((frame, new_rect.topleft, None))
+
+    def get(self, angle):
+        i = round(angle / self.step) % self.count
+        frame = self.frames[i]
+        if frame[2] is None:
+            frame = self.frames[i] = (frame[0], frame[1], pygame.mask.from_surface(frame[0]))
+        return frame
+
+
+def load_rotations(path, factor=1, step=ROTATION_STEP):
+    key = (path, factor, step)
+    image = load_image(path, factor)
+    cached = _ROTATIONS.get(key)
+    # Rebuild if the source image was converted since the cache was made.
+    if cached is None or cached[0] is not image:
+        cached = (image, RotationCache(image, step))
+        _ROTATIONS[key] = cached
+    return cached[1]
+
+
+def cache_rotations(path, factor, step, rotated):
+    # Hands load_rotations sprites rotated elsewhere; they are only used while
+    # load_image keeps returning the image they were cached with.
+    image = _IMAGES[(path, factor)]
+    _ROTATIONS.setdefault((path, factor, step), (image, RotationCache(image, step, rotated)))
+
+
+def load_font(name, size):
+    key = (name, size)
+    font = _FONTS.get(key)
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = pygame.font.SysFont(name, size)
+        _FONTS[key] = font
+    return font
@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+import bundle
+import utils
+import vs_computer
+import vs_multiplayer
+from assets import load_image
+from renderer import Renderer
+from simulation import Autopilot
+from track import DEFAULT_TRACK, get_track, track_names
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def time_call(func, repeat=5, number=1000):
+    # Best of `repeat` runs, in microseconds per call.
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number * 1e6
+
+
+def micro_benchmarks(win, track):
+    race = vs_computer.Race(seed=1, track=track)
+    pilot = Autopilot(track.path, track.border_field)
+    race.run(300, lambda sim: (pilot(sim.player_car),))
+    player_car, computer_car, game_info = race.player_car, race.computer_car, race.game_info
+    field = vs_computer.Race(seed=1, opponents=vs_computer.MAX_OPPONENTS, track=track)
+    collectible = vs_computer.Collectible(400, 400, True)
+    renderer = Renderer(win, track.layers())
+    full_renderer = Renderer(win, track.layers(), dirty_rects=False)
+    car_image = load_image(vs_computer.RED_CAR, vs_computer.CAR_SCALE)
+
+    def computer_move():
+        computer_car.current_point = 0
+        computer_car.x, computer_car.y = computer_car.start_pos
+        computer_car.move()
+
+    cases = {
+        "draw": lambda: vs_computer.draw(renderer, player_car, [computer_car], game_info),
+        "draw_full_window": lambda: vs_computer.draw(full_renderer, player_car, [computer_car], game_info),
+        "AbstractCar.collide": lambda: player_car.collide(track.finish_mask, *track.finish_position),
+        "AbstractCar.hits_wall": lambda: player_car.hits_wall(track.border_field),
+        "Collectible.collect": lambda: collectible.collect(player_car),
+        "blit_rotate_center": lambda: utils.blit_rotate_center(win, car_image, (300, 300), 37),
+        "ComputerCar.move": computer_move,
+        "CarBatch.follow_line": lambda: field.batch.follow_line(track.racing_line),
+        "handle_collectibles": lambda: vs_computer.handle_collectibles(player_car, [computer_car], game_info),
+    }
+    results = {}
+    for name, func in cases.items():
+        number = 200 if name.startswith("draw") else 5000
+        results[name] = {"us_per_call": round(time_call(func, number=number), 3)}
+        print(f"  {name:<24} {results[name]['us_per_call']:>10.3f} us")
+    return results
+
+
+def race_frames(win, mode, track, frames, seed, opponents=1):
+    # A full windowed frame minus the frame-rate cap: step the scripted race,
+    # then draw it.
+    renderer = Renderer(win, track.layers())
+    samples = []
+    race = None
+    for frame in range(frames):
+        if race is None:
+            race = mode.Race(seed=seed + frame, opponents=opponents, track=track) if mode is vs_computer else \
+                mode.Race(seed=seed + frame, track=track)
+            pilots = [Autopilot(track.path, track.border_field) for _ in range(2)]
+            race.game_info.start_level()
+            renderer.invalidate()
+
+        start = time.perf_counter_ns()
+        if mode is vs_computer:
+            outcome = race.step(pilots[0](race.player_car))
+            vs_computer.draw(renderer, race.player_car, race.computer_cars, race.game_info)
+        else:
+            outcome = race.step(pilots[0](race.player1), pilots[1](race.player2))
+            vs_multiplayer.draw(renderer, race.player1, race.player2, race.game_info)
+        samples.append(time.perf_counter_ns() - start)
+
+        if outcome in race.END_OUTCOMES:
+            race = None
+
+    result = {"frames": frames, "mean_ms": round(sum(samples) / len(samples) / 1e6, 4),
+              "max_ms": round(max(samples) / 1e6, 4)}
+    for p in PERCENTILES:
+        result[f"p{p}_ms"] = round(percentile(samples, p) / 1e6, 4)
+    return result
+
+
+def macro_benchmarks(win, track, frames, seed):
+    results = {}
+    for name, mode, opponents in (("vs_computer", vs_computer, 1), ("vs_multiplayer", vs_multiplayer, 1),
+                                  (f"vs_computer_{vs_computer.MAX_OPPONENTS}", vs_computer,
+                                   vs_computer.MAX_OPPONENTS)):
+        result = race_frames(win, mode, track, frames, seed, opponents)
+        results[name] = result
+        print(f"  {name:<24} p50 {result['p50_ms']:.3f} ms  p99 {result['p99_ms']:.3f} ms  "
+              f"max {result['max_ms']:.3f} ms")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous):
+    print(f"Compared with {previous.get('commit')}:")
+    for section, key in (("micro", "us_per_call"), ("macro", "p50_ms"), ("macro", "p99_ms")):
+        for name, result in current[section].items():
+            old = previous.get(section, {}).get(name, {}).get(key)
+            if old:
+                print(f"  {name:<24} {key:<12} {old:>10.3f} -> {result[key]:>10.3f}  ({result[key] / old:.2f}x)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the game loop hot paths headless.")
+    parser.add_argument("--frames", type=int, default=3000, help="frames per scripted race benchmark")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--track", choices=track_names(), default=DEFAULT_TRACK)
+    parser.add_argument("--output", default="benchmark.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--skip-macro", action="store_true")
+    parser.add_argument("--no-bundle", action="store_true", help="load images from their files, not the asset bundle")
+    args = parser.parse_args(argv)
+
+    pygame.init()
+    bundled = not args.no_bundle and bundle.load()
+    track = get_track(args.track)
+    win = pygame.display.set_mode(track.size)
+
+    results = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "bundle": bundled,
+        "track": args.track,
+    }
+    start = time.perf_counter()
+    track.preload()
+    vs_computer.Race(seed=args.seed, track=track)
+    results["startup_s"] = round(time.perf_counter() - start, 4)
+    print(f"Race setup: {results['startup_s']:.3f} s")
+    print("Micro benchmarks:")
+    results["micro"] = micro_benchmarks(win, track)
+    results["macro"] = {}
+    if not args.skip_macro:
+        print(f"Scripted races ({args.frames} frames each):")
+        results["macro"] = macro_benchmarks(win, track, args.frames, args.seed)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,170 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import pygame
+from assets import load_image, load_rotations, cache_image, cache_rotations
+from track import CACHE_DIR, get_track, track_names
+from utils import atomic_write
+
+# The asset bundle holds every image the game draws, already decoded, scaled
+# and in the display pixel format, plus the pre-rotated car sprites. The game
+# maps the file into memory and wraps each image as a surface over its bytes,
+# so starting up decodes, scales and copies nothing and blits never have to
+# convert pixels. Build it with `python bundle.py` after changing images.
+#
+# The file is a header, a JSON index of the images and where their pixels
+# are, then the pixels themselves, each image starting on an ALIGN boundary.
+
+BUNDLE_PATH = os.path.join(CACHE_DIR, "assets.bundle")
+MAGIC = b"RGAB"
+VERSION = 1
+# magic, version, index size
+HEADER = struct.Struct("<4sBI")
+ALIGN = 64
+
+# Mapped bundles stay open for as long as their surfaces may be drawn.
+_MAPS = []
+
+
+def _pixel_format(surface):
+    # The tobytes/frombuffer format string matching the surface's byte order.
+    channels = {}
+    for channel, mask in zip("RGBA", surface.get_masks()):
+        channels[(mask.bit_length() - 1) // 8] = channel
+    order = "".join(channels[i] for i in range(4))
+    return order if sys.byteorder == "little" else order[::-1]
+
+
+def _digest(images, rotations):
+    digest = hashlib.sha1(json.dumps([VERSION, images, rotations]).encode())
+    for path in sorted({path for path, _ in images}):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _aligned(size):
+    return size + -size % ALIGN
+
+
+def build(images, rotations, path=BUNDLE_PATH):
+    # images is a list of (path, factor) as passed to load_image, rotations
+    # the ones whose rotated sprites are baked too. Needs a window, which
+    # sets the display format. Returns the size of the bundle in bytes.
+    images = [[image_path, factor] for image_path, factor in images]
+    rotations = [[image_path, factor, load_rotations(image_path, factor).step] for image_path, factor in rotations]
+    pixel_format = _pixel_format(pygame.Surface((1, 1), pygame.SRCALPHA).convert_alpha())
+    data = bytearray()
+
+    def add(surface):
+        data.extend(bytes(_aligned(len(data)) - len(data)))
+        offset = len(data)
+        data.extend(pygame.image.tobytes(surface, pixel_format))
+        return [offset, *surface.get_size()]
+
+    index = {
+        "format": pixel_format,
+        "digest": _digest(images, rotations),
+        "images": [[image_path, factor, *add(load_image(image_path, factor))] for image_path, factor in images],
+        "rotations": [[image_path, factor, step, [add(frame) for frame, _, _ in load_rotations(image_path, factor).frames]]
+                      for image_path, factor, step in rotations],
+    }
+    encoded = json.dumps(index).encode()
+    with atomic_write(path) as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(encoded)))
+        f.write(encoded)
+        f.write(bytes(_aligned(HEADER.size + len(encoded)) - HEADER.size - len(encoded)))
+        f.write(data)
+        return f.tell()
+
+
+def load(path=BUNDLE_PATH):
+    # Hands every image in the bundle to the asset cache. Does nothing and
+    # returns False when there is no bundle, it can't be read or it is out of
+    # date with the source images, in which case they are loaded from those
+    # as usual.
+    try:
+        images, rotations, data = _read(path)
+    except (OSError, ValueError, KeyError, TypeError, struct.error):
+        return False
+    if images is None:
+        return False
+    for (image_path, factor), image in images:
+        cache_image(image_path, factor, image)
+    for (image_path, factor, step), frames in rotations:
+        cache_rotations(image_path, factor, step, frames)
+    _MAPS.append(data)
+    return True
+
+
+def _read(path):
+    # The bundle's images and rotated sprites as surfaces over the mapped
+    # file, or None for both when it is out of date.
+    with open(path, "rb") as f:
+        # A private mapping: pages are shared with the file until something
+        # draws on a surface, which then never writes back to the file.
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    magic, version, size = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        return None, None, data
+    index = json.loads(data[HEADER.size:HEADER.size + size])
+    if index["digest"] != _digest([entry[:2] for entry in index["images"]],
+                                  [entry[:3] for entry in index["rotations"]]):
+        return None, None, data
+
+    view = memoryview(data)
+    start = _aligned(HEADER.size + size)
+
+    def surface(offset, width, height):
+        offset += start
+        return pygame.image.frombuffer(view[offset:offset + width * height * 4], (width, height), index["format"])
+
+    images = [(tuple(entry[:2]), surface(*entry[2:])) for entry in index["images"]]
+    rotations = [(tuple(entry[:3]), [surface(*frame) for frame in entry[3]]) for entry in index["rotations"]]
+    return images, rotations, data
+
+
+def game_images(tracks=None):
+    # Every image the menu and both modes draw on the named tracks, or on
+    # every track, and the car sprites they rotate.
+    import vs_computer
+    import vs_multiplayer
+    cars = []
+    for module in (vs_computer, vs_multiplayer):
+        for car in (module.RED_CAR, module.GREEN_CAR, getattr(module, "WHITE_CAR", None)):
+            if car is not None and (car, module.CAR_SCALE) not in cars:
+                cars.append((car, module.CAR_SCALE))
+    images = []
+    for name in tracks or track_names():
+        track = get_track(name)
+        for image in (track.grass_image, track.track_image, track.border_image, track.finish_image):
+            if image not in images:
+                images.append(image)
+    images += cars + [(vs_computer.BOOST_IMG, 1), (vs_computer.SLOWER_IMG, 1)]
+    return images, cars
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bake the game's images into a memory-mapped asset bundle.")
+    parser.add_argument("--output", default=BUNDLE_PATH)
+    parser.add_argument("--track", action="append", choices=track_names(),
+                        help="bake this track's images; repeat for more (default: every track)")
+    args = parser.parse_args()
+
+    pygame.init()
+    pygame.display.set_mode((1, 1), pygame.HIDDEN)
+    start = time.perf_counter()
+    images, rotations = game_images(args.track)
+    size = build(images, rotations, args.output)
+    print(f"Baked {len(images)} images and {len(rotations)} rotated cars into {args.output} "
+          f"({size / 1e6:.1f} MB) in {time.perf_counter() - start:.2f}s")
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import numpy as np
+from racing_line import STEERING_GAIN, MAX_CORRECTION
+
+# Array name -> car attribute it backs.
+FIELDS = {
+    "x": "x",
+    "y": "y",
+    "angle": "angle",
+    "vel": "vel",
+    "max_vel": "max_vel",
+    "base_max_vel": "base_max_vel",
+    "rotation_vel": "rotation_vel",
+    "acceleration": "acceleration",
+    "speed_multiplier": "speed_multiplier",
+    "effect_end_time": "effect_end_time",
+    "cruise_vel": "cruise_vel",
+    "lateral_offset": "lateral_offset",
+    "cornering": "cornering",
+    "path_index": "current_point",
+}
+
+
+class _Field:
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, car, owner=None):
+        if car is None:
+            return self
+        return getattr(car._batch, self.name)[car._slot].item()
+
+    def __set__(self, car, value):
+        getattr(car._batch, self.name)[car._slot] = value
+
+
+_VIEW_CLASSES = {}
+
+
+def _view_class(cls):
+    view = _VIEW_CLASSES.get(cls)
+    if view is None:
+        attrs = {attr: _Field(name) for name, attr in FIELDS.items()}
+        view = type(cls.__name__, (cls,), attrs)
+        _VIEW_CLASSES[cls] = view
+    return view
+
+
+class CarBatch:
+    # Struct-of-arrays store for many cars. Cars added to a batch keep their
+    # class and methods, but their physics attributes become views into the
+    # arrays here, so the per-object code and the vectorized steps below see
+    # the same state.
+    def __init__(self, capacity=64):
+        self.size = 0
+        self.capacity = capacity
+        self.cars = []
+        for name in FIELDS:
+            dtype = np.int64 if name == "path_index" else np.float64
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.width = np.zeros(capacity)
+        self.height = np.zeros(capacity)
+
+    def _grow(self):
+        self.capacity *= 2
+        for name in list(FIELDS) + ["width", "height"]:
+            old = getattr(self, name)
+            new = np.zeros(self.capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def add(self, car):
+        if self.size == self.capacity:
+            self._grow()
+
+        slot = self.size
+        for name, attr in FIELDS.items():
+            getattr(self, name)[slot] = getattr(car, attr, 0)
+            car.__dict__.pop(attr, None)
+        self.width[slot], self.height[slot] = car.img.get_size()
+
+        car._batch = self
+        car._slot = slot
+        car.__class__ = _view_class(type(car))
+        self.cars.append(car)
+        self.size += 1
+        return slot
+
+    def _select(self, mask):
+        active = np.ones(self.size, dtype=bool)
+        if mask is not None:
+            active &= mask
+        return active
+
+    def move(self, mask=None):
+        n = self.size
+        active = self._select(mask)
+        radians = np.radians(self.angle[:n])
+        vel = np.where(active, self.vel[:n], 0)
+        self.y[:n] -= np.cos(radians) * vel
+        self.x[:n] -= np.sin(radians) * vel
+
+    def follow_line(self, line, mask=None):
+        # Vectorized ComputerCar.move along a RacingLine.
+        n = self.size
+        active = self._select(mask)
+        x = self.x[:n] + self.width[:n] / 2
+        y = self.y[:n] + self.height[:n] / 2
+        positions = line.positions
+        last = len(positions) - 1
+
+        index = self.path_index[:n]
+        # The line ends just before the finish line, so cars past its last
+        # entry start their lap at the first.
+        index[active & (index == last)] = 0
+        here = ((positions[index] - np.column_stack((x, y))) ** 2).sum(axis=1)
+        while True:
+            ahead = ((positions[np.minimum(index + 1, last)] - np.column_stack((x, y))) ** 2).sum(axis=1)
+            step = active & (index < last) & (ahead <= here)
+            if not step.any():
+                break
+            index += step
+            here = np.where(step, ahead, here)
+
+        point, left = positions[index], line.left[index]
+        correction = ((x - point[:, 0]) * left[:, 0] + (y - point[:, 1]) * left[:, 1]
+                      - self.lateral_offset[:n]) * STEERING_GAIN
+        correction = np.clip(correction, -MAX_CORRECTION, MAX_CORRECTION)
+        difference = (line.headings[index] - correction - self.angle[:n] + 180) % 360 - 180
+        rotation_vel = self.rotation_vel[:n]
+        difference = np.clip(difference, -rotation_vel, rotation_vel)
+        self.angle[:n] += np.where(active, difference, 0)
+
+        vel = np.minimum(self.cruise_vel[:n] * self.speed_multiplier[:n], line.speeds[index] * rotation_vel * self.cornering[:n])
+        self.vel[:n] = np.where(active, vel, self.vel[:n])
+        self.move(active)
+
+    def update_speed_effects(self, current_time):
+        n = self.size
+        expired = current_time >= self.effect_end_time[:n]
+        self.speed_multiplier[:n] = np.where(expired, 1.0, self.speed_multiplier[:n])
+        self.max_vel[:n] = np.where(expired, self.base_max_vel[:n], self.max_vel[:n])
@@ -0,0 +1,136 @@
+import math
+from spatial import sweep_and_prune
+
+# Car against car collisions. Every car is an oriented box the size of its
+# image, centered on the image and turned to its heading. A sort-and-sweep
+# over the boxes' bounding rects finds the pairs worth a closer look, and a
+# separating axis test on the two oriented boxes finds how deep they overlap
+# and along which axis. Overlapping cars are pushed apart by half the depth
+# each and swap the parts of their velocities along that axis, as equal
+# masses do in an elastic collision. Cars can only move along their heading,
+# so each car keeps the part of its new velocity along its heading.
+#
+# Against the walls each car is a capsule along its heading (wall_capsule),
+# swept from where it was at the start of the tick to where it is now.
+
+# Cars moving further than this many pixels in a tick are swept in sub-steps.
+WALL_STEP = 4
+# Push-outs tried on a car still touching a wall after its move.
+PUSH_OUTS = 3
+# Extra pixels each push-out goes past the measured depth: the field is
+# sampled per pixel, so pushing exactly the depth can leave the car in the
+# same pixel, still touching.
+PUSH_MARGIN = 0.5
+
+
+def car_box(car):
+    # center x, center y, forward x, forward y, half width, half height
+    width, height = car.img.get_size()
+    radians = math.radians(car.angle)
+    return car.x + width / 2, car.y + height / 2, -math.sin(radians), -math.cos(radians), width / 2, height / 2
+
+
+def bounds(box):
+    x, y, forward_x, forward_y, half_width, half_height = box
+    reach_x = abs(forward_y) * half_width + abs(forward_x) * half_height
+    reach_y = abs(forward_x) * half_width + abs(forward_y) * half_height
+    return x - reach_x, y - reach_y, x + reach_x, y + reach_y
+
+
+def penetration(a, b):
+    # Separating axis test. Returns the overlap depth and the unit axis
+    # pointing from a to b it is smallest along, or None when the boxes
+    # don't overlap.
+    ax, ay, afx, afy, aw, ah = a
+    bx, by, bfx, bfy, bw, bh = b
+    dx, dy = bx - ax, by - ay
+    best = None
+    # Each box's side axis is its forward axis turned a quarter.
+    for nx, ny in ((afx, afy), (afy, -afx), (bfx, bfy), (bfy, -bfx)):
+        reach_a = aw * abs(afy * nx - afx * ny) + ah * abs(afx * nx + afy * ny)
+        reach_b = bw * abs(bfy * nx - bfx * ny) + bh * abs(bfx * nx + bfy * ny)
+        distance = dx * nx + dy * ny
+        depth = reach_a + reach_b - abs(distance)
+        if depth <= 0:
+            return None
+        if best is None or depth < best[0]:
+            best = (depth, nx, ny) if distance >= 0 else (depth, -nx, -ny)
+    return best
+
+
+def wall_capsule(car, x, y):
+    # Segment ends and radius of the car's capsule with its image at x, y.
+    width, height = car.img.get_size()
+    radius = width / 2
+    radians = math.radians(car.angle)
+    reach = height / 2 - radius
+    dx, dy = math.sin(radians) * reach, math.cos(radians) * reach
+    center_x, center_y = x + width / 2, y + height / 2
+    return center_x - dx, center_y - dy, center_x + dx, center_y + dy, radius
+
+
+def collide_wall(car, field, start_x, start_y, start_angle):
+    # Moves the car back to where its move from start_x, start_y first
+    # touches a wall and bounces it back along its heading for the rest of
+    # the tick. The sweep only moves the capsule, so a turn from start_angle
+    # that swings the car into a wall is undone first. A car already
+    # touching a wall at the start, e.g. after another car pushed it into
+    # one, is not swept and keeps its speed: it is only pushed out along the
+    # wall normal, so it never bounces on the spot. Returns the time of
+    # impact as a fraction of the move, or None.
+    touching = field.hits_capsule(*wall_capsule(car, start_x, start_y))
+    if touching and car.angle != start_angle:
+        angle, car.angle = car.angle, start_angle
+        touching = field.hits_capsule(*wall_capsule(car, start_x, start_y))
+        if touching:
+            # Touching before the turn too: the turn isn't to blame.
+            car.angle = angle
+    toi = None
+    if not touching:
+        dx, dy = car.x - start_x, car.y - start_y
+        toi = field.sweep_capsule(*wall_capsule(car, start_x, start_y), dx, dy, WALL_STEP)
+    if toi is not None:
+        # Back to the point of impact, then the rest of the move reversed.
+        back = 2 * (1 - toi)
+        _push(car, -dx * back, -dy * back)
+        car.vel = -car.vel
+    for _ in range(PUSH_OUTS):
+        contact = field.capsule_contact(*wall_capsule(car, car.x, car.y))
+        if contact is None:
+            break
+        depth, normal_x, normal_y = contact
+        _push(car, normal_x * (depth + PUSH_MARGIN), normal_y * (depth + PUSH_MARGIN))
+    return toi
+
+
+def _push(car, dx, dy):
+    car.x += dx
+    car.y += dy
+    if hasattr(car, "rect"):
+        car.rect.center = (car.x, car.y)
+
+
+def resolve(a, b, box_a, box_b, depth, nx, ny):
+    half = depth / 2
+    _push(a, -nx * half, -ny * half)
+    _push(b, nx * half, ny * half)
+
+    # Only cars moving towards each other along the axis exchange velocity.
+    _, _, afx, afy, _, _ = box_a
+    _, _, bfx, bfy, _, _ = box_b
+    approach = (a.vel * afx - b.vel * bfx) * nx + (a.vel * afy - b.vel * bfy) * ny
+    if approach > 0:
+        a.vel -= approach * (afx * nx + afy * ny)
+        b.vel += approach * (bfx * nx + bfy * ny)
+
+
+def collide_cars(cars):
+    # Returns the (car, car) pairs that collided this tick.
+    boxes = [car_box(car) for car in cars]
+    hits = []
+    for i, j in sweep_and_prune([bounds(box) for box in boxes]):
+        contact = penetration(boxes[i], boxes[j])
+        if contact is not None:
+            resolve(cars[i], cars[j], boxes[i], boxes[j], *contact)
+            hits.append((cars[i], cars[j]))
+    return hits
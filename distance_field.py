@@ -0,0 +1,140 @@
+import math
+import numpy as np
+import pygame
+
+MAX_DISTANCE = 64
+SWEEP_BISECTIONS = 4
+
+
+def mask_to_array(mask):
+    surface = mask.to_surface(setcolor=(255, 255, 255, 255), unsetcolor=(0, 0, 0, 0))
+    return pygame.surfarray.array_alpha(surface) > 0
+
+
+def _distance_to(feature, max_distance):
+    # Exact Euclidean distance from every pixel to the nearest feature pixel,
+    # clamped to max_distance. Arrays are indexed [x, y] like pygame.surfarray.
+    width, height = feature.shape
+    limit = max_distance + 1
+
+    # Pass 1: distance along y to the nearest feature in the same column.
+    column = np.where(feature, 0, limit).astype(np.float64)
+    for y in range(1, height):
+        column[:, y] = np.minimum(column[:, y], column[:, y - 1] + 1)
+    for y in range(height - 2, -1, -1):
+        column[:, y] = np.minimum(column[:, y], column[:, y + 1] + 1)
+    column = np.minimum(column, limit) ** 2
+
+    # Pass 2: combine columns within max_distance along x.
+    squared = column.copy()
+    for offset in range(1, limit):
+        shifted = column[offset:] + offset ** 2
+        np.minimum(squared[:-offset], shifted, out=squared[:-offset])
+        shifted = column[:-offset] + offset ** 2
+        np.minimum(squared[offset:], shifted, out=squared[offset:])
+
+    return np.minimum(np.sqrt(squared), max_distance)
+
+
+class DistanceField:
+    # Signed distance to the nearest wall pixel: positive in free space,
+    # zero or negative inside walls. The gradient points away from walls and
+    # is used as the wall normal.
+    def __init__(self, distance, gradient_x, gradient_y, max_distance=MAX_DISTANCE):
+        self.distance_array = distance
+        self.gradient_x = gradient_x
+        self.gradient_y = gradient_y
+        self.max_distance = max_distance
+        self.width, self.height = distance.shape
+
+    @classmethod
+    def from_mask(cls, mask, max_distance=MAX_DISTANCE):
+        wall = mask_to_array(mask)
+        distance = _distance_to(wall, max_distance) - _distance_to(~wall, max_distance)
+        distance = distance.astype(np.float32)
+        gradient_x, gradient_y = np.gradient(distance)
+        return cls(distance, gradient_x, gradient_y, max_distance)
+
+    def distance(self, x, y):
+        x, y = int(x), int(y)
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return float(self.distance_array[x, y])
+        return float(self.max_distance)
+
+    def normal(self, x, y):
+        x, y = int(x), int(y)
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return 0.0, 0.0
+        gx, gy = float(self.gradient_x[x, y]), float(self.gradient_y[x, y])
+        length = math.hypot(gx, gy)
+        if length == 0:
+            return 0.0, 0.0
+        return gx / length, gy / length
+
+    def hits_point(self, x, y):
+        return self.distance(x, y) <= 0
+
+    def hits_circle(self, x, y, radius):
+        return self.distance(x, y) < radius
+
+    def hits_capsule(self, x0, y0, x1, y1, radius):
+        # Circles of the given radius spaced along the segment, at most one
+        # radius apart.
+        samples = max(1, math.ceil(math.hypot(x1 - x0, y1 - y0) / radius))
+        for i in range(samples + 1):
+            t = i / samples
+            if self.hits_circle(x0 + (x1 - x0) * t, y0 + (y1 - y0) * t, radius):
+                return True
+        return False
+
+    def capsule_contact(self, x0, y0, x1, y1, radius):
+        # Deepest overlap of a capsule with the walls, sampled like
+        # hits_capsule: (depth, normal x, normal y), or None when it is clear.
+        samples = max(1, math.ceil(math.hypot(x1 - x0, y1 - y0) / radius))
+        deepest = None
+        for i in range(samples + 1):
+            t = i / samples
+            x, y = x0 + (x1 - x0) * t, y0 + (y1 - y0) * t
+            depth = radius - self.distance(x, y)
+            if depth > 0 and (deepest is None or depth > deepest[0]):
+                deepest = (depth, *self.normal(x, y))
+        return deepest
+
+    def sweep_capsule(self, x0, y0, x1, y1, radius, dx, dy, step):
+        # Time of impact of a capsule moved by (dx, dy): the fraction of the
+        # move it makes before touching a wall, or None when it never does.
+        # The capsule must be clear of the walls where it starts.
+        # Moves longer than step pixels are checked every step pixels, so
+        # fast capsules can't skip over thin walls, and a hit is narrowed
+        # down by bisection.
+        steps = max(1, math.ceil(math.hypot(dx, dy) / step))
+        free = 0.0
+        for i in range(1, steps + 1):
+            t = i / steps
+            if self.hits_capsule(x0 + dx * t, y0 + dy * t, x1 + dx * t, y1 + dy * t, radius):
+                break
+            free = t
+        else:
+            return None
+        hit = t
+        for _ in range(SWEEP_BISECTIONS):
+            t = (free + hit) / 2
+            if self.hits_capsule(x0 + dx * t, y0 + dy * t, x1 + dx * t, y1 + dy * t, radius):
+                hit = t
+            else:
+                free = t
+        return free
+
+    def raycast(self, x, y, dx, dy, max_length, radius=0):
+        # Sphere tracing: step by the distance to the nearest wall until a
+        # circle of the given radius would touch one. Returns the distance
+        # travelled along (dx, dy) or None.
+        length = math.hypot(dx, dy)
+        dx, dy = dx / length, dy / length
+        travelled = 0.0
+        while travelled <= max_length:
+            distance = self.distance(x + dx * travelled, y + dy * travelled)
+            if distance <= radius:
+                return travelled
+            travelled += max(distance - radius, 1.0)
+        return None
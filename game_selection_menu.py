@@ -1,76 +1,84 @@
 import pygame
 import sys
+import time
+from assets import load_font
+from scenes import Scene, SceneManager
+from track import DEFAULT_TRACK, get_track
 
-WIDTH = 800
-HEIGHT = 600
-
-
-def init_pygame():
-    pygame.init()
-    pygame.font.init()
-    return pygame.display.set_mode((WIDTH, HEIGHT))
+# Computer cars in the VS Field race.
+FIELD_OPPONENTS = 16
 
 
 def create_main_font():
-    return pygame.font.SysFont("comicsans", 44)
+    return load_font("comicsans", 44)
 
 
 def draw_menu(win, font):
+    width, height = win.get_size()
     win.fill((0, 0, 0))
 
     title = font.render("Racing Game", 1, (255, 255, 255))
-    title_rect = title.get_rect(center=(WIDTH // 2, HEIGHT // 4))
+    title_rect = title.get_rect(center=(width // 2, height // 4))
     win.blit(title, title_rect)
 
     vs_computer_text = font.render("Press 1: VS Computer", 1, (255, 255, 255))
     vs_player_text = font.render("Press 2: VS Player", 1, (255, 255, 255))
+    vs_field_text = font.render("Press 3: VS Field", 1, (255, 255, 255))
     quit_text = font.render("Press Q: Quit", 1, (255, 255, 255))
 
-    vs_computer_rect = vs_computer_text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-    vs_player_rect = vs_player_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 + 50))
-    quit_rect = quit_text.get_rect(center=(WIDTH // 2, HEIGHT // 2 + 100))
+    vs_computer_rect = vs_computer_text.get_rect(center=(width // 2, height // 2))
+    vs_player_rect = vs_player_text.get_rect(center=(width // 2, height // 2 + 50))
+    vs_field_rect = vs_field_text.get_rect(center=(width // 2, height // 2 + 100))
+    quit_rect = quit_text.get_rect(center=(width // 2, height // 2 + 150))
 
     win.blit(vs_computer_text, vs_computer_rect)
     win.blit(vs_player_text, vs_player_rect)
+    win.blit(vs_field_text, vs_field_rect)
     win.blit(quit_text, quit_rect)
 
     pygame.display.update()
 
 
-def main():
-    win = init_pygame()
-    pygame.display.set_caption("Racing Game!")
-    font = create_main_font()
-    clock = pygame.time.Clock()
-
-    running = True
-    while running:
-        clock.tick(60)
-        draw_menu(win, font)
+class MenuScene(Scene):
+    def __init__(self, start=None):
+        self.font = create_main_font()
+        self.start = start
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
+    def enter(self, manager):
+        super().enter(manager)
+        pygame.display.set_caption("Racing Game!")
 
+    def frame(self, events):
+        for event in events:
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_1:
                     import vs_computer
-                    result = vs_computer.run()
-                    if result == "quit":
-                         running = False
-                    pygame.display.set_mode((WIDTH, HEIGHT))
+                    self.manager.push(vs_computer.RaceScene(track=self.manager.track))
+                    return
                 elif event.key == pygame.K_2:
                     import vs_multiplayer
-                    result = vs_multiplayer.run()
-                    if result == "quit":
-                         running = False
-                    pygame.display.set_mode((WIDTH, HEIGHT))
+                    self.manager.push(vs_multiplayer.RaceScene(self.manager.track))
+                    return
+                elif event.key == pygame.K_3:
+                    import vs_computer
+                    self.manager.push(vs_computer.RaceScene(FIELD_OPPONENTS, self.manager.track))
+                    return
                 elif event.key == pygame.K_q:
-                    running = False
+                    self.manager.quit()
+                    return
+
+        draw_menu(self.manager.win, self.font)
+        if self.start is not None:
+            print(f"Menu ready in {time.perf_counter() - self.start:.2f}s")
+            self.start = None
+
 
-    pygame.quit()
+def main(track=DEFAULT_TRACK):
+    start = time.perf_counter()
+    SceneManager(track=get_track(track)).run(MenuScene(start))
     sys.exit()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # python game_selection_menu.py [track]
+    main(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TRACK)
@@ -0,0 +1,32 @@
+from collections import OrderedDict
+from assets import load_font
+
+WHITE = (255, 255, 255)
+
+
+class Hud:
+    # Rendered text surfaces keyed by (text, color). HUD values only change a
+    # few times per second, so most frames reuse a surface instead of
+    # rasterizing the string again. The cache is bounded, oldest entries go
+    # first. The font is only loaded on first use.
+    def __init__(self, font_name, font_size, max_size=64):
+        self.font_name = font_name
+        self.font_size = font_size
+        self.max_size = max_size
+        self._surfaces = OrderedDict()
+
+    @property
+    def font(self):
+        return load_font(self.font_name, self.font_size)
+
+    def render(self, text, color=WHITE):
+        key = (text, color)
+        surface = self._surfaces.get(key)
+        if surface is None:
+            surface = self.font.render(text, 1, color)
+            self._surfaces[key] = surface
+            if len(self._surfaces) > self.max_size:
+                self._surfaces.popitem(last=False)
+        else:
+            self._surfaces.move_to_end(key)
+        return surface
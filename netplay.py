@@ -0,0 +1,441 @@
+import argparse
+import heapq
+import math
+import os
+import random
+import socket
+import struct
+import sys
+import time
+import pygame
+import bundle
+from vs_multiplayer import Race, HUD, FPS, draw
+from utils import blit_text_center
+from renderer import Renderer
+from track import DEFAULT_TRACK, get_track, track_names
+import snapshot
+from simulation import Autopilot, PLAYER1_KEYS, PLAYER2_KEYS, read_input
+
+# Two-player races over UDP. The server runs the authoritative Race at a
+# fixed tick rate and sends its state to both clients every tick. Each client
+# runs its own copy of the race ahead of the server with its own inputs and
+# the last known input of the other player. When the server's state for a
+# tick differs from the prediction the client rolls back to it and replays
+# its own inputs since then.
+
+PORT = 5555
+HELLO, WELCOME, INPUT, STATE = range(4)
+OUTCOMES = (None, "player1_won", "player2_won", "finished")
+
+# type, slot, seed; the name of the track to race on follows
+WELCOME_PACKET = struct.Struct("!BBI")
+# type, newest input tick, input count, newest server state received
+INPUT_HEADER = struct.Struct("!BIBI")
+# type, tick, newest input tick received, other player's input, outcome, base tick
+STATE_HEADER = struct.Struct("!BIIBBI")
+
+# Every input packet repeats this many of the latest ticks, so a lost packet
+# is covered by the next one.
+REDUNDANCY = 8
+HELLO_INTERVAL = 0.5
+# States are sent as deltas against the newest state the client has
+# confirmed; both sides keep this many ticks of history to decode them.
+HISTORY = 2 * FPS
+
+
+class Link:
+    # A non-blocking UDP socket that can delay, jitter and drop the packets it
+    # sends, to try out bad networks on one machine. Counts traffic both ways.
+    def __init__(self, address=("0.0.0.0", 0), latency=0.0, jitter=0.0, loss=0.0, rng=None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(address)
+        self.sock.setblocking(False)
+        self.address = self.sock.getsockname()
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = rng or random.Random()
+        self.queue = []
+        self._sequence = 0
+
+        self.bytes_sent = 0
+        self.packets_sent = 0
+        self.bytes_received = 0
+        self.packets_received = 0
+        self.dropped = 0
+
+    def send(self, data, address, now):
+        self.bytes_sent += len(data)
+        self.packets_sent += 1
+        if self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        due = now + self.latency + self.rng.uniform(0, self.jitter)
+        heapq.heappush(self.queue, (due, self._sequence, data, address))
+        self._sequence += 1
+        self.flush(now)
+
+    def flush(self, now):
+        while self.queue and self.queue[0][0] <= now:
+            _, _, data, address = heapq.heappop(self.queue)
+            self.sock.sendto(data, address)
+
+    def receive(self):
+        while True:
+            try:
+                data, address = self.sock.recvfrom(2048)
+            except (BlockingIOError, ConnectionResetError):
+                return
+            self.bytes_received += len(data)
+            self.packets_received += 1
+            yield data, address
+
+    def close(self):
+        self.sock.close()
+
+
+class Server:
+    def __init__(self, link, seed=None, track=None):
+        self.link = link
+        self.race = Race(seed, track)
+        self.clients = []
+        self.inputs = [{}, {}]
+        self.last_input = [0, 0]
+        self.acks = [0, 0]
+        self.baselines = [0, 0]
+        self.history = {}
+        self.outcome = None
+
+    @property
+    def started(self):
+        return len(self.clients) == 2
+
+    def poll(self, now):
+        self.link.flush(now)
+        for data, address in self.link.receive():
+            # Anyone can send to the server's port: packets that are empty,
+            # too short or of an unknown type are dropped.
+            if not data:
+                continue
+            if data[0] == HELLO:
+                if address not in self.clients and len(self.clients) < 2:
+                    self.clients.append(address)
+                if address in self.clients:
+                    slot = self.clients.index(address)
+                    welcome = WELCOME_PACKET.pack(WELCOME, slot, self.race.seed) + self.race.track.name.encode()
+                    self.link.send(welcome, address, now)
+            elif data[0] == INPUT and address in self.clients and len(data) >= INPUT_HEADER.size:
+                slot = self.clients.index(address)
+                newest, count, baseline = INPUT_HEADER.unpack_from(data)[1:]
+                if len(data) < INPUT_HEADER.size + count:
+                    continue
+                self.baselines[slot] = max(self.baselines[slot], baseline)
+                for i, bits in enumerate(data[INPUT_HEADER.size:INPUT_HEADER.size + count]):
+                    tick = newest - count + 1 + i
+                    if tick > self.race.ticks:
+                        self.inputs[slot][tick] = bits
+                self.acks[slot] = max(self.acks[slot], newest)
+
+    def tick(self, now):
+        if not self.started or self.outcome is not None:
+            return
+        tick = self.race.ticks + 1
+        for slot in range(2):
+            # A late input is replaced by the player's previous one; the
+            # client rolls back when it sees the result.
+            self.last_input[slot] = self.inputs[slot].pop(tick, self.last_input[slot])
+        outcome = self.race.step(*self.last_input)
+        if outcome in Race.END_OUTCOMES:
+            self.outcome = outcome
+        self.broadcast(now)
+
+    def broadcast(self, now):
+        tick = self.race.ticks
+        state = snapshot.take(self.race)
+        self.history[tick] = state
+        self.history.pop(tick - HISTORY, None)
+        for slot, address in enumerate(self.clients):
+            base_tick = self.baselines[slot]
+            base = self.history.get(base_tick)
+            if base is None or base_tick == tick:
+                base_tick, payload = 0, state
+            else:
+                payload = snapshot.encode_delta(base, state)
+            header = STATE_HEADER.pack(STATE, tick, self.acks[slot], self.last_input[1 - slot],
+                                       OUTCOMES.index(self.outcome), base_tick)
+            self.link.send(header + payload, address, now)
+
+
+class Client:
+    def __init__(self, link, server_address):
+        self.link = link
+        self.server_address = server_address
+        self.slot = None
+        self.race = None
+        self.server_tick = None
+        self.outcome = None
+
+        self.inputs = {}
+        self.predicted = {}
+        self.received = {}
+        self.send_times = {}
+        self.remote_input = 0
+        self.rtt = None
+        self.acked = 0
+        self.last_hello = None
+
+        self.ticks = 0
+        self.rollbacks = 0
+        self.replayed_ticks = 0
+
+    @property
+    def car(self):
+        return (self.race.player1, self.race.player2)[self.slot]
+
+    @property
+    def lead(self):
+        # How many ticks to run ahead of the last server state so inputs reach
+        # the server before it simulates their tick.
+        rtt = self.rtt or 0.0
+        return math.ceil(rtt * FPS) + 2
+
+    def poll(self, now):
+        self.link.flush(now)
+        if self.slot is None and (self.last_hello is None or now - self.last_hello >= HELLO_INTERVAL):
+            self.link.send(bytes([HELLO]), self.server_address, now)
+            self.last_hello = now
+
+        for data, address in self.link.receive():
+            if address != self.server_address or not data:
+                continue
+            if data[0] == WELCOME and self.slot is None and len(data) > WELCOME_PACKET.size:
+                # A track without a manifest here can't be raced on.
+                track = data[WELCOME_PACKET.size:].decode(errors="replace")
+                if track not in track_names():
+                    continue
+                _, self.slot, seed = WELCOME_PACKET.unpack_from(data)
+                self.race = Race(seed, get_track(track))
+            elif data[0] == STATE and self.race is not None and len(data) >= STATE_HEADER.size:
+                self.receive_state(data, now)
+
+    def receive_state(self, data, now):
+        _, tick, ack, remote_input, outcome, base_tick = STATE_HEADER.unpack_from(data)
+        if self.server_tick is not None and tick <= self.server_tick:
+            return
+        state = data[STATE_HEADER.size:]
+        if base_tick:
+            base = self.received.get(base_tick)
+            if base is None:
+                return
+            state = snapshot.apply_delta(base, state)
+        self.received[tick] = state
+        for old in [t for t in self.received if t <= tick - HISTORY]:
+            del self.received[old]
+
+        self.server_tick = tick
+        self.remote_input = remote_input
+        self.outcome = OUTCOMES[outcome]
+
+        if ack > self.acked:
+            self.acked = ack
+            sent = self.send_times.get(ack)
+            if sent is not None:
+                sample = now - sent
+                self.rtt = sample if self.rtt is None else self.rtt * 0.9 + sample * 0.1
+            for old in [t for t in self.send_times if t <= ack]:
+                del self.send_times[old]
+
+        current = self.race.ticks
+        if tick > current:
+            # Behind the server, e.g. right after joining: jump to its state.
+            snapshot.restore(self.race, state)
+        elif self.predicted.get(tick) != state:
+            self.rollbacks += 1
+            self.replayed_ticks += current - tick
+            snapshot.restore(self.race, state)
+            for replay in range(tick + 1, current + 1):
+                self._step(self.inputs[replay])
+
+        for old in [t for t in self.inputs if t <= tick]:
+            del self.inputs[old]
+        for old in [t for t in self.predicted if t <= tick]:
+            del self.predicted[old]
+
+    def _step(self, bits):
+        inputs = [self.remote_input, self.remote_input]
+        inputs[self.slot] = bits
+        self.race.step(*inputs)
+        self.predicted[self.race.ticks] = snapshot.take(self.race)
+
+    def tick(self, bits, now):
+        # Advances the predicted race by one tick, or by two or none to keep
+        # the lead over the server steady.
+        if self.server_tick is None or self.outcome is not None:
+            return
+        ahead = self.race.ticks - self.server_tick
+        steps = 2 if ahead < self.lead else 0 if ahead > self.lead + 2 else 1
+        for _ in range(steps):
+            self._step(bits)
+            tick = self.race.ticks
+            self.inputs[tick] = bits
+            self.send_times[tick] = now
+            self.ticks += 1
+        if steps:
+            self.send_inputs(now)
+
+    def send_inputs(self, now):
+        newest = self.race.ticks
+        ticks = [t for t in range(newest - REDUNDANCY + 1, newest + 1) if t in self.inputs]
+        payload = bytes(self.inputs[t] for t in ticks)
+        header = INPUT_HEADER.pack(INPUT, newest, len(payload), self.server_tick)
+        self.link.send(header + payload, self.server_address, now)
+
+
+def report(name, link, ticks, client=None):
+    ticks = max(ticks, 1)
+    line = (f"{name:<8} up {link.bytes_sent / ticks:7.1f} B/tick  down {link.bytes_received / ticks:7.1f} B/tick"
+            f"  dropped {link.dropped}")
+    if client is not None:
+        line += (f"  rollbacks {client.rollbacks} ({client.rollbacks / max(client.ticks, 1):.1%} of ticks,"
+                 f" {client.replayed_ticks / max(client.rollbacks, 1):.1f} ticks replayed each)"
+                 f"  rtt {(client.rtt or 0) * 1000:.0f} ms")
+    print(line)
+
+
+def loopback(ticks=3000, latency=0.05, jitter=0.01, loss=0.02, seed=1, track=DEFAULT_TRACK):
+    # Server and two autopiloted clients in one process over 127.0.0.1, on a
+    # simulated clock so it runs as fast as the machine allows.
+    rng = random.Random(seed)
+    track = get_track(track)
+    server_link = Link(("127.0.0.1", 0), latency, jitter, loss, random.Random(rng.random()))
+    server = Server(server_link, seed, track)
+    clients = [Client(Link(("127.0.0.1", 0), latency, jitter, loss, random.Random(rng.random())),
+                      server_link.address) for _ in range(2)]
+    pilots = [Autopilot(track.path, track.border_field) for _ in clients]
+
+    frame = 0
+    while server.race.ticks < ticks and server.outcome is None:
+        now = frame / FPS
+        server.poll(now)
+        for client in clients:
+            client.poll(now)
+        server.tick(now)
+        for client, pilot in zip(clients, pilots):
+            client.tick(pilot(client.car) if client.race else 0, now)
+        frame += 1
+
+    print(f"Loopback: {server.race.ticks} ticks, latency {latency * 1000:.0f} ms, "
+          f"jitter {jitter * 1000:.0f} ms, loss {loss:.0%}, outcome {server.outcome}")
+    report("server", server_link, server.race.ticks)
+    for slot, client in enumerate(clients):
+        report(f"client{slot + 1}", client.link, client.ticks, client)
+    for link in [server_link] + [client.link for client in clients]:
+        link.close()
+    return server, clients
+
+
+def serve(port, latency, jitter, loss, seed, track=DEFAULT_TRACK):
+    link = Link(("0.0.0.0", port), latency, jitter, loss)
+    server = Server(link, seed, get_track(track))
+    print(f"Waiting for two players on port {link.address[1]} to race on {track}")
+    start = time.perf_counter()
+    next_tick = start
+    while server.outcome is None:
+        now = time.perf_counter()
+        server.poll(now - start)
+        if not server.started:
+            next_tick = now
+        while now >= next_tick:
+            server.tick(now - start)
+            next_tick += 1 / FPS
+        time.sleep(0.001)
+
+    # Keep telling the clients about the result for a moment.
+    for _ in range(FPS):
+        server.broadcast(time.perf_counter() - start)
+        time.sleep(1 / FPS)
+    print(f"Race over: {server.outcome}")
+    report("server", link, server.race.ticks)
+    link.close()
+
+
+def play(host, port, latency, jitter, loss):
+    pygame.init()
+    bundle.load()
+    # The server picks the track: until it has said which, the window shows
+    # the default one.
+    track = get_track()
+    win = pygame.display.set_mode(track.size)
+    pygame.display.set_caption("Racing Game - Network")
+    track.preload()
+    renderer = Renderer(win, track.layers())
+    link = Link(latency=latency, jitter=jitter, loss=loss)
+    client = Client(link, (socket.gethostbyname(host), port))
+    clock = pygame.time.Clock()
+    start = time.perf_counter()
+
+    while client.outcome is None:
+        clock.tick(FPS)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                link.close()
+                pygame.quit()
+                return
+        now = time.perf_counter() - start
+        client.poll(now)
+        if client.race is not None and client.race.track is not track:
+            track = client.race.track
+            win = pygame.display.set_mode(track.size)
+            track.preload()
+            renderer = Renderer(win, track.layers())
+        if client.server_tick is None:
+            renderer.invalidate()
+            win.blit(renderer.background, (0, 0))
+            blit_text_center(win, HUD.font, "Waiting for the other player...")
+            pygame.display.update()
+            continue
+
+        keys = pygame.key.get_pressed()
+        client.tick(read_input(keys, PLAYER1_KEYS) | read_input(keys, PLAYER2_KEYS), now)
+        draw(renderer, client.race.player1, client.race.player2, client.race.game_info)
+
+    winner = {"player1_won": "Player 1 Won!", "player2_won": "Player 2 Won!"}.get(client.outcome, "Race over")
+    blit_text_center(win, HUD.font, winner)
+    pygame.display.update()
+    report(f"player{client.slot + 1}", link, client.ticks, client)
+    pygame.time.wait(3000)
+    link.close()
+    pygame.quit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Two-player races over UDP.")
+    parser.add_argument("--latency", type=float, default=0, help="added one-way latency in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="added random latency in ms")
+    parser.add_argument("--loss", type=float, default=0, help="fraction of sent packets to drop")
+    commands = parser.add_subparsers(dest="command", required=True)
+    server = commands.add_parser("server")
+    server.add_argument("--port", type=int, default=PORT)
+    server.add_argument("--seed", type=int)
+    server.add_argument("--track", choices=track_names(), default=DEFAULT_TRACK)
+    client = commands.add_parser("client")
+    client.add_argument("host")
+    client.add_argument("--port", type=int, default=PORT)
+    test = commands.add_parser("loopback", help="headless server and two scripted clients on this machine")
+    test.add_argument("--ticks", type=int, default=3000)
+    test.add_argument("--seed", type=int, default=1)
+    test.add_argument("--track", choices=track_names(), default=DEFAULT_TRACK)
+    args = parser.parse_args(argv)
+    latency, jitter = args.latency / 1000, args.jitter / 1000
+
+    if args.command == "server":
+        serve(args.port, latency, jitter, args.loss, args.seed, args.track)
+    elif args.command == "client":
+        play(args.host, args.port, latency, jitter, args.loss)
+    else:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        loopback(args.ticks, latency, jitter, args.loss, args.seed, args.track)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,105 @@
+import csv
+import time
+from array import array
+import pygame
+from hud import Hud
+
+OVERLAY_KEY = pygame.K_F3
+CSV_KEY = pygame.K_F4
+# One file per profiler, named after it and when it was made, since each
+# mode times a different set of phases.
+CSV_PATH = "frame_profile-{name}-{time}.csv"
+
+
+class FrameProfiler:
+    # Times each phase of a frame with perf_counter_ns into fixed-size ring
+    # buffers. A phase lasts from the previous mark (or begin_frame) to its
+    # own mark. F3 shows rolling p50/p99 per phase, F4 streams every frame to
+    # CSV.
+    def __init__(self, phases, name="game", size=600, csv_path=CSV_PATH, refresh=30):
+        self.phases = tuple(phases)
+        self.size = size
+        self.samples = {phase: array("q", [0]) * size for phase in self.phases}
+        self.frame = dict.fromkeys(self.phases, 0)
+        self.index = 0
+        self.count = 0
+        self.last = 0
+
+        self.show_overlay = False
+        self.refresh = refresh
+        self.hud = Hud("comicsans", 20)
+        self.overlay_lines = []
+
+        self.csv_path = csv_path.format(name=name, time=time.strftime("%Y%m%d-%H%M%S"))
+        self.csv_file = None
+        self.csv_writer = None
+
+    def begin_frame(self):
+        self.last = time.perf_counter_ns()
+
+    def skip(self):
+        # Time since the last mark is not counted in any phase.
+        self.last = time.perf_counter_ns()
+
+    def mark(self, phase):
+        now = time.perf_counter_ns()
+        self.frame[phase] += now - self.last
+        self.last = now
+
+    def end_frame(self):
+        for phase in self.phases:
+            self.samples[phase][self.index] = self.frame[phase]
+        if self.csv_writer is not None:
+            self.csv_writer.writerow([self.frame[phase] for phase in self.phases])
+
+        self.frame = dict.fromkeys(self.phases, 0)
+        self.index = (self.index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        if self.show_overlay and self.index % self.refresh == 0:
+            self.overlay_lines = self.summary_lines()
+
+    def percentiles(self, phase, points=(50, 99)):
+        ordered = sorted(self.samples[phase][:self.count])
+        if not ordered:
+            return [0 for _ in points]
+        return [ordered[min(len(ordered) - 1, len(ordered) * p // 100)] for p in points]
+
+    def summary_lines(self):
+        lines = []
+        for phase in self.phases:
+            p50, p99 = self.percentiles(phase)
+            lines.append(f"{phase:<20} p50 {p50 / 1e6:6.2f} ms  p99 {p99 / 1e6:6.2f} ms")
+        return lines
+
+    def start_csv(self):
+        self.csv_file = open(self.csv_path, "a", newline="")
+        self.csv_writer = csv.writer(self.csv_file)
+        if self.csv_file.tell() == 0:
+            self.csv_writer.writerow([f"{phase}_ns" for phase in self.phases])
+
+    def stop_csv(self):
+        if self.csv_file is not None:
+            self.csv_file.close()
+        self.csv_file = None
+        self.csv_writer = None
+
+    def handle_event(self, event):
+        if event.type != pygame.KEYDOWN:
+            return
+        if event.key == OVERLAY_KEY:
+            self.show_overlay = not self.show_overlay
+            self.overlay_lines = self.summary_lines()
+        elif event.key == CSV_KEY:
+            if self.csv_writer is None:
+                self.start_csv()
+            else:
+                self.stop_csv()
+
+    def draw_overlay(self, win):
+        if not self.show_overlay:
+            return
+        y = 10
+        for line in self.overlay_lines:
+            text = self.hud.render(line, (255, 255, 0))
+            win.blit(text, (10, y))
+            y += text.get_height()
@@ -0,0 +1,163 @@
+import heapq
+import math
+import numpy as np
+
+# Racing line planning for the computer cars. A shortest path through the
+# distance field that prefers the middle of the track gives the centerline
+# from just past the finish line all the way round to just before it. That
+# line is then pulled tight while keeping MARGIN pixels from the walls, and
+# resampled into a dense table the cars index into every tick.
+
+VERSION = 1
+GRID = 4
+SPACING = 4
+MARGIN = 14
+# How strongly the centerline search avoids walls; higher hugs the middle.
+CENTER_WEIGHT = 30
+SMOOTHING_STEPS = 600
+# Target speeds are the lowest over this many table entries ahead, so cars
+# slow down before a corner rather than in it.
+BRAKING_WINDOW = 12
+MAX_SPEED = 1000.0
+# Cars following the line turn this many degrees towards it per pixel they
+# are off to the side, up to MAX_CORRECTION degrees.
+STEERING_GAIN = 1.5
+MAX_CORRECTION = 45.0
+# Everything a planned line depends on besides the track.
+SETTINGS = (VERSION, GRID, SPACING, MARGIN, CENTER_WEIGHT, SMOOTHING_STEPS, BRAKING_WINDOW)
+
+
+class RacingLine:
+    # Dense table along the line: positions, headings in the cars' angle
+    # convention (0 is up, positive turns left) and target speeds. A speed is
+    # in pixels per tick for each degree per tick the car can turn, so a car
+    # with rotation_vel r can take entry i at up to r * speeds[i].
+    def __init__(self, positions, headings, speeds):
+        self.positions = positions
+        self.headings = headings
+        self.speeds = speeds
+        radians = np.radians(headings)
+        # Unit vectors pointing to the left of the direction of travel.
+        self.left = np.column_stack((-np.cos(radians), np.sin(radians)))
+        # Plain Python lists for the per-car lookups, which are faster than
+        # indexing numpy arrays one element at a time: x, y, left x, left y,
+        # heading and speed per entry.
+        self.xs = positions[:, 0].tolist()
+        self.ys = positions[:, 1].tolist()
+        self.entries = list(zip(self.xs, self.ys, *self.left.T.tolist(), headings.tolist(), speeds.tolist()))
+
+    def __len__(self):
+        return len(self.xs)
+
+    def advance(self, i, x, y):
+        # Moves from entry i to the nearest entry ahead of (x, y): forward
+        # for as long as entries get closer.
+        xs, ys = self.xs, self.ys
+        last = len(xs) - 1
+        dx, dy = xs[i] - x, ys[i] - y
+        here = dx * dx + dy * dy
+        while i < last:
+            dx, dy = xs[i + 1] - x, ys[i + 1] - y
+            ahead = dx * dx + dy * dy
+            if ahead > here:
+                break
+            here = ahead
+            i += 1
+        return i
+
+
+def _clearance(field, points):
+    x = np.clip(points[:, 0].astype(int), 0, field.width - 1)
+    y = np.clip(points[:, 1].astype(int), 0, field.height - 1)
+    return field.distance_array[x, y], field.gradient_x[x, y], field.gradient_y[x, y]
+
+
+def centerline(field, start, goal, blocked):
+    # Dijkstra over GRID sized cells with at least a car's half width of
+    # clearance, never entering the blocked rect (the finish line).
+    width, height = field.width // GRID, field.height // GRID
+    centers = (np.arange(width) * GRID + GRID // 2, np.arange(height) * GRID + GRID // 2)
+    clearance = field.distance_array[np.ix_(centers[0], centers[1])]
+    free = clearance > MARGIN / 2
+    left, top, right, bottom = blocked
+    free[max(0, left // GRID):right // GRID + 1, max(0, top // GRID):bottom // GRID + 1] = False
+
+    start = (start[0] // GRID, start[1] // GRID)
+    goal = (goal[0] // GRID, goal[1] // GRID)
+    costs = {start: 0.0}
+    previous = {}
+    queue = [(0.0, start)]
+    steps = [(dx, dy, math.hypot(dx, dy)) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+    while queue:
+        cost, cell = heapq.heappop(queue)
+        if cell == goal:
+            break
+        if cost > costs[cell]:
+            continue
+        cx, cy = cell
+        for dx, dy, length in steps:
+            nx, ny = cx + dx, cy + dy
+            if not (0 <= nx < width and 0 <= ny < height and free[nx, ny]):
+                continue
+            new_cost = cost + length * (1 + (CENTER_WEIGHT / clearance[nx, ny]) ** 2)
+            if new_cost < costs.get((nx, ny), math.inf):
+                costs[nx, ny] = new_cost
+                previous[nx, ny] = cell
+                heapq.heappush(queue, (new_cost, (nx, ny)))
+    else:
+        raise ValueError("no way round the track from the start to the goal")
+
+    cells = [goal]
+    while cells[-1] != start:
+        cells.append(previous[cells[-1]])
+    cells.reverse()
+    return np.array(cells, dtype=np.float64) * GRID + GRID // 2
+
+
+def resample(points, spacing):
+    lengths = np.hypot(*np.diff(points, axis=0).T)
+    distance = np.concatenate(([0.0], np.cumsum(lengths)))
+    samples = np.arange(0.0, distance[-1], spacing)
+    return np.column_stack((np.interp(samples, distance, points[:, 0]),
+                            np.interp(samples, distance, points[:, 1])))
+
+
+def smooth(points, field, steps=SMOOTHING_STEPS):
+    # Moves every point towards the midpoint of its neighbours, which
+    # straightens the line and cuts corners, then pushes points that got
+    # closer than MARGIN to a wall back out along the wall normal. The ends
+    # stay put.
+    points = points.copy()
+    for _ in range(steps):
+        midpoints = (points[:-2] + points[2:]) / 2
+        points[1:-1] += (midpoints - points[1:-1]) * 0.5
+        distance, gradient_x, gradient_y = _clearance(field, points)
+        push = np.clip(MARGIN - distance, 0, None)
+        length = np.hypot(gradient_x, gradient_y)
+        length[length == 0] = 1
+        points[1:-1, 0] += (push * gradient_x / length)[1:-1]
+        points[1:-1, 1] += (push * gradient_y / length)[1:-1]
+    return points
+
+
+def build(field, start, goal, blocked):
+    line = resample(centerline(field, start, goal, blocked), SPACING)
+    line = resample(smooth(line, field), SPACING)
+
+    direction = np.gradient(line, axis=0)
+    headings = np.degrees(np.arctan2(-direction[:, 0], -direction[:, 1]))
+    turn = np.radians((np.diff(headings) + 180) % 360 - 180)
+    curvature = np.abs(np.convolve(np.append(turn, 0.0), np.ones(5) / 5, mode="same")) / SPACING
+    speeds = np.minimum(np.radians(1) / np.maximum(curvature, 1e-9), MAX_SPEED)
+    ahead = np.concatenate((speeds, np.full(BRAKING_WINDOW, MAX_SPEED)))
+    speeds = np.min([ahead[i:i + len(speeds)] for i in range(BRAKING_WINDOW)], axis=0)
+    return RacingLine(line, headings, speeds)
+
+
+def plan(field, finish_rect):
+    # The line starts just past the finish line and ends just before it.
+    left, top, width, height = finish_rect
+    start = (left + width // 2, top - 2 * GRID)
+    goal = (left + width // 2, top + height + 2 * GRID)
+    blocked = (left, top, left + width, top + height)
+    return build(field, start, goal, blocked)
@@ -0,0 +1,42 @@
+import pygame
+
+
+class Renderer:
+    # Draws a frame on top of a background composited once from the static
+    # layers. With dirty_rects on, only the areas drawn in the previous and
+    # current frame are restored and passed to pygame.display.update.
+    def __init__(self, win, layers, dirty_rects=True):
+        self.win = win
+        self.dirty_rects = dirty_rects
+        self.background = pygame.Surface(win.get_size()).convert()
+        for img, pos in layers:
+            self.background.blit(img, pos)
+
+        self.previous_rects = []
+        self.current_rects = []
+        self.full_redraw = True
+
+    def invalidate(self):
+        self.full_redraw = True
+
+    def begin_frame(self):
+        if self.full_redraw or not self.dirty_rects:
+            self.win.blit(self.background, (0, 0))
+        else:
+            for rect in self.previous_rects:
+                self.win.blit(self.background, rect, rect)
+
+    def blit(self, surface, pos):
+        rect = self.win.blit(surface, pos)
+        self.current_rects.append(rect)
+        return rect
+
+    def end_frame(self):
+        if self.full_redraw or not self.dirty_rects:
+            pygame.display.update()
+            self.full_redraw = False
+        else:
+            pygame.display.update(self.previous_rects + self.current_rects)
+
+        self.previous_rects = self.current_rects
+        self.current_rects = []
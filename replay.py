@@ -0,0 +1,222 @@
+import argparse
+import glob
+import importlib
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+import pygame
+import bundle
+import snapshot
+from renderer import Renderer
+from track import DEFAULT_TRACK, get_track, track_names
+
+# A replay is the race's track, seed and number of computer cars, the input
+# bits of every tick, one byte per tick (player 1 in the low four bits,
+# player 2 in the high four), and the snapshot of the final state.
+# Re-simulating the inputs from the seed reproduces the race exactly, so
+# playback can also check the final state.
+
+REPLAY_DIR = "replays"
+# Races in the window are only recorded when this environment variable is
+# set to something other than 0, and only the newest KEEP_REPLAYS recordings
+# in REPLAY_DIR are kept, so a game left running never fills the disk.
+RECORD_ENV = "RACING_REPLAYS"
+KEEP_REPLAYS = 50
+MODES = ("vs_computer", "vs_multiplayer")
+MAGIC = b"RR"
+VERSION = 3
+# magic, version, mode, opponents, seed, ticks, final snapshot size, track
+# name size. The track name follows the header.
+HEADER = struct.Struct("<2sBBBIIIB")
+
+
+class Recorder:
+    # Set as race.recorder to log every step of the race.
+    def __init__(self, race):
+        self.mode = race.MODE
+        self.track = race.track.name
+        self.seed = race.seed
+        self.opponents = len(getattr(race, "computer_cars", ()))
+        self.inputs = array("B")
+
+    def record(self, inputs):
+        bits = 0
+        for player, player_bits in enumerate(inputs):
+            bits |= player_bits << player * 4
+        self.inputs.append(bits)
+
+    def save(self, race, path=None):
+        prune = path is None
+        if prune:
+            os.makedirs(REPLAY_DIR, exist_ok=True)
+            path = os.path.join(REPLAY_DIR, f"{self.mode}-{time.strftime('%Y%m%d-%H%M%S')}-{self.seed}.replay")
+        final = snapshot.take(race)
+        track = self.track.encode()
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, MODES.index(self.mode), self.opponents, self.seed, len(self.inputs),
+                                len(final), len(track)))
+            f.write(track)
+            f.write(final)
+            f.write(zlib.compress(self.inputs.tobytes(), 9))
+        if prune:
+            _prune(REPLAY_DIR, KEEP_REPLAYS)
+        return path
+
+
+def recording():
+    # Whether races in the window are recorded.
+    return os.environ.get(RECORD_ENV, "0") not in ("", "0")
+
+
+def _prune(directory, keep):
+    # Removes all but the newest keep replays in directory.
+    paths = sorted(glob.glob(os.path.join(directory, "*.replay")), key=os.path.getmtime)
+    for path in paths[:-keep]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class Replay:
+    def __init__(self, mode, seed, inputs, final, opponents=0, track=DEFAULT_TRACK):
+        self.mode = mode
+        self.track = track
+        self.seed = seed
+        self.opponents = opponents
+        self.inputs = inputs
+        self.final = final
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, mode, opponents, seed, ticks, final_size, track_size = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} replay")
+        start = HEADER.size + track_size
+        track = data[HEADER.size:start].decode()
+        if track not in track_names():
+            raise ValueError(f"{path} was raced on track {track!r}, which has no manifest")
+        offset = start + final_size
+        inputs = array("B", zlib.decompress(data[offset:]))
+        if len(inputs) != ticks:
+            raise ValueError(f"{path} is truncated")
+        return cls(MODES[mode], seed, inputs, data[start:offset], opponents, track)
+
+    @property
+    def module(self):
+        return importlib.import_module(self.mode)
+
+    def new_race(self):
+        track = get_track(self.track)
+        if self.opponents:
+            return self.module.Race(self.seed, self.opponents, track)
+        return self.module.Race(self.seed, track=track)
+
+    def step(self, race, tick):
+        bits = self.inputs[tick]
+        if self.mode == "vs_multiplayer":
+            return race.step(bits & 15, bits >> 4)
+        return race.step(bits & 15)
+
+    def verify(self):
+        # Re-simulates the whole replay as fast as possible. Returns whether
+        # the final state matches the recording and the time it took.
+        race = self.new_race()
+        start = time.perf_counter()
+        for tick in range(len(self.inputs)):
+            self.step(race, tick)
+        elapsed = time.perf_counter() - start
+        return snapshot.take(race) == self.final, elapsed
+
+    def play(self, speed=1.0):
+        module = self.module
+        pygame.init()
+        bundle.load()
+        race = self.new_race()
+        win = pygame.display.set_mode(race.track.size)
+        pygame.display.set_caption(f"Racing Game - Replay ({self.mode})")
+        race.track.preload()
+        renderer = Renderer(win, race.track.layers())
+        clock = pygame.time.Clock()
+
+        for tick in range(len(self.inputs)):
+            clock.tick(module.FPS * speed)
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    return None
+            self.step(race, tick)
+            if self.opponents:
+                module.draw(renderer, race.player_car, race.computer_cars, race.game_info)
+            else:
+                module.draw(renderer, *race.cars, race.game_info)
+
+        pygame.quit()
+        return snapshot.take(race) == self.final
+
+
+def record_autopilot(mode, seed, path, opponents=1, track=DEFAULT_TRACK):
+    # Records a scripted race, e.g. a full 10 level session as a regression
+    # workload. In vs_computer the player drives the racing line and passes
+    # the computer cars, which wins all 10 levels.
+    from simulation import Autopilot, LinePilot
+    module = importlib.import_module(mode)
+    track = get_track(track)
+    race = module.Race(seed, opponents, track) if mode == "vs_computer" else module.Race(seed, track=track)
+    race.recorder = Recorder(race)
+    if mode == "vs_computer":
+        pilot = LinePilot(track.racing_line, track.border_field, race.computer_cars)
+        race.run(100000, lambda sim: (pilot(sim.cars[0]),))
+    else:
+        pilots = [Autopilot(track.path, track.border_field) for _ in range(2)]
+        race.run(100000, lambda sim: (pilots[0](sim.cars[0]), pilots[1](sim.cars[1])))
+    return race.recorder.save(race, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record, play back and verify race replays.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    play = commands.add_parser("play", help="watch a replay in the window")
+    play.add_argument("path")
+    play.add_argument("--speed", type=float, default=1.0)
+    verify = commands.add_parser("verify", help="re-simulate headless and check the final state")
+    verify.add_argument("path")
+    verify.add_argument("--repeat", type=int, default=1)
+    record = commands.add_parser("record", help="record a scripted race")
+    record.add_argument("--mode", choices=MODES, default="vs_computer")
+    record.add_argument("--seed", type=int, default=1)
+    record.add_argument("--opponents", type=int, default=1, help="computer cars in a vs_computer race")
+    record.add_argument("--track", choices=track_names(), default=DEFAULT_TRACK)
+    record.add_argument("--output", default="autopilot.replay")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        path = record_autopilot(args.mode, args.seed, args.output, args.opponents, args.track)
+        print(f"Recorded {len(Replay.load(path).inputs)} ticks to {path}")
+        return 0
+
+    replay = Replay.load(args.path)
+    if args.command == "play":
+        matches = replay.play(args.speed)
+        if matches is not None:
+            print("Final state matches" if matches else "Final state differs")
+        return 0 if matches is not False else 1
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    ok = True
+    for _ in range(args.repeat):
+        matches, elapsed = replay.verify()
+        ok = ok and matches
+        print(f"{len(replay.inputs)} ticks in {elapsed:.2f}s ({len(replay.inputs) / elapsed:.0f} ticks/s), "
+              f"final state {'matches' if matches else 'differs'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,280 @@
+import logging
+import pygame
+import bundle
+import replay
+import utils
+from utils import wait_events, blit_text_center
+from assets import load_font
+from profiler import FrameProfiler
+from renderer import Renderer
+from simulation import FixedStep, Interpolation
+from track import get_track
+
+# One window, one clock and a stack of scenes: the menu, races and end
+# screens. Only the scene on top runs. Scenes switch by pushing, popping or
+# replacing themselves on the manager, so going from a race back to the menu
+# and into another race never nests loops or keeps old races alive.
+
+log = logging.getLogger(__name__)
+
+# Frame-rate cap for running races. The races simulate at their own fixed
+# tick rate whatever this is and draw the cars between ticks.
+RENDER_FPS = 144
+
+
+class Scene:
+    # Frames per second while the scene runs, or None for a scene that waits
+    # for input and only redraws after events, capped at utils.IDLE_FPS.
+    fps = None
+    profiler = None
+
+    def enter(self, manager):
+        # Called whenever the scene comes to the top of the stack. The
+        # window may show another scene until the next frame is drawn.
+        self.manager = manager
+
+    def frame(self, events):
+        raise NotImplementedError
+
+    def leave(self):
+        # Called when the scene is removed from the stack.
+        pass
+
+
+class SceneManager:
+    # track is the one the window is sized for and races started from the
+    # menu are run on.
+    def __init__(self, caption="Racing Game!", track=None):
+        pygame.init()
+        bundle.load()
+        self.track = track or get_track()
+        self.win = pygame.display.set_mode(self.track.size)
+        pygame.display.set_caption(caption)
+        self.clock = pygame.time.Clock()
+        self.stack = []
+        # Set to have an idle scene draw a frame without waiting for an
+        # event, e.g. when it comes to the top or starts waiting.
+        self.redraw = False
+
+    @property
+    def top(self):
+        return self.stack[-1] if self.stack else None
+
+    def _enter_top(self):
+        if self.stack:
+            self.stack[-1].enter(self)
+            self.redraw = True
+
+    def push(self, scene):
+        self.stack.append(scene)
+        self._enter_top()
+
+    def pop(self):
+        self.stack.pop().leave()
+        self._enter_top()
+
+    def replace(self, scene):
+        self.stack.pop().leave()
+        self.push(scene)
+
+    def back_to_menu(self):
+        # Pops back to the menu, or replaces everything with one when the
+        # game was started without it.
+        from game_selection_menu import MenuScene
+        while self.stack and not isinstance(self.top, MenuScene):
+            self.stack.pop().leave()
+        if self.stack:
+            self._enter_top()
+        else:
+            self.push(MenuScene())
+
+    def quit(self):
+        while self.stack:
+            self.stack.pop().leave()
+
+    def run(self, scene):
+        self.push(scene)
+        while self.stack:
+            scene = self.top
+            if scene.fps is None:
+                self.clock.tick(utils.IDLE_FPS)
+                events = wait_events()
+                if not events and not self.redraw:
+                    continue
+            else:
+                profiler = scene.profiler
+                if profiler:
+                    profiler.begin_frame()
+                self.clock.tick(scene.fps)
+                if profiler:
+                    profiler.mark("wait")
+                events = pygame.event.get()
+            self.redraw = False
+
+            if any(event.type == pygame.QUIT for event in events):
+                self.quit()
+            else:
+                scene.frame(events)
+        pygame.quit()
+
+
+class Button:
+    def __init__(self, x, y, width, height, text, color=(100, 100, 100)):
+        self.rect = pygame.Rect(x, y, width, height)
+        self.text = text
+        self.color = color
+        self.font = load_font("comicsans", 30)
+        self.text_surface = self.font.render(self.text, True, (255, 255, 255))
+
+    def draw(self, win):
+        pygame.draw.rect(win, self.color, self.rect)
+        text_rect = self.text_surface.get_rect(center=self.rect.center)
+        win.blit(self.text_surface, text_rect)
+
+    def is_clicked(self, pos):
+        return self.rect.collidepoint(pos)
+
+
+def save_replay(race):
+    if race.recorder:
+        log.info("Replay saved to %s", race.recorder.save(race))
+
+
+class RaceScene(Scene):
+    # A race in the window. Before each level it waits for a key, then steps
+    # the race at its fixed tick rate with the keys held down and draws the
+    # cars blended between ticks. Each mode subclasses it with how to draw
+    # its race, which keys drive which car and how the race ended.
+    caption = "Racing Game!"
+
+    def __init__(self, race):
+        self.race = race
+        self.profiler = FrameProfiler(("wait", "draw", "events") + race.PHASES, race.MODE)
+        race.profiler = self.profiler
+        if replay.recording():
+            race.recorder = replay.Recorder(race)
+        self.saved = False
+        self.waiting = True
+        self.stepper = FixedStep(race.clock.rate)
+        self.poses = Interpolation(race.cars)
+
+    @property
+    def fps(self):
+        # Before each level the scene waits for a key and only redraws
+        # after events.
+        return None if self.waiting else RENDER_FPS
+
+    def draw(self, renderer, profiler=None):
+        raise NotImplementedError
+
+    def inputs(self, keys):
+        # The input bits of every player from the keys held down.
+        raise NotImplementedError
+
+    def prompt(self):
+        return "Press any key to start the race!"
+
+    def end_message(self, outcome):
+        raise NotImplementedError
+
+    def restart(self):
+        # A new race like this one.
+        raise NotImplementedError
+
+    def enter(self, manager):
+        super().enter(manager)
+        pygame.display.set_caption(self.caption)
+        self.race.track.preload()
+        self.renderer = Renderer(manager.win, self.race.track.layers())
+
+    def leave(self):
+        # Races left before they end, e.g. by closing the window, are
+        # recorded too.
+        if not self.saved:
+            save_replay(self.race)
+        self.profiler.stop_csv()
+
+    def frame(self, events):
+        race, profiler = self.race, self.profiler
+        if self.waiting:
+            if not any(event.type == pygame.KEYDOWN for event in events):
+                self.draw(self.renderer)
+                self.renderer.invalidate()
+                blit_text_center(self.manager.win, load_font("comicsans", 44), self.prompt())
+                pygame.display.update()
+                return
+            # The level itself starts on this frame's step, so replays see
+            # it too.
+            self.waiting = False
+            profiler.skip()
+            self.stepper.reset()
+
+        for event in events:
+            profiler.handle_event(event)
+        profiler.mark("events")
+
+        outcome = None
+        for _ in range(self.stepper.ticks()):
+            self.poses.save()
+            outcome = race.step(*self.inputs(pygame.key.get_pressed()))
+            if outcome is not None:
+                break
+        if outcome in race.END_OUTCOMES:
+            profiler.end_frame()
+            save_replay(race)
+            self.saved = True
+            self.manager.replace(EndScreen(self.end_message(outcome), self.restart))
+            return
+        if not race.game_info.started:
+            # The cars jumped back to the start: nothing to blend. The
+            # prompt for the next level is drawn on the next frame.
+            self.waiting = True
+            self.manager.redraw = True
+            self.poses.save()
+
+        with self.poses.blend(self.stepper.alpha):
+            self.draw(self.renderer, profiler)
+        profiler.mark("draw")
+        profiler.end_frame()
+
+
+class EndScreen(Scene):
+    # How a race ended, with buttons to race again, go back to the menu or
+    # quit. restart makes the scene for the next race.
+    def __init__(self, message, restart):
+        self.message = message
+        self.restart = restart
+
+    def enter(self, manager):
+        super().enter(manager)
+        width, height = manager.win.get_size()
+        self.text = load_font("comicsans", 44).render(self.message, True, (255, 255, 255))
+        self.text_rect = self.text.get_rect(center=(width // 2, height // 4))
+
+        button_width, button_height = 200, 50
+        button_x = width // 2 - button_width // 2
+        self.restart_button = Button(button_x, height // 2 - 60, button_width, button_height, "Restart")
+        self.game_menu_button = Button(button_x, height // 2, button_width, button_height, "Game Menu")
+        self.quit_button = Button(button_x, height // 2 + 60, button_width, button_height, "Quit")
+
+    def frame(self, events):
+        for event in events:
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                mouse_pos = event.pos
+                if self.restart_button.is_clicked(mouse_pos):
+                    self.manager.replace(self.restart())
+                    return
+                elif self.quit_button.is_clicked(mouse_pos):
+                    self.manager.quit()
+                    return
+                elif self.game_menu_button.is_clicked(mouse_pos):
+                    self.manager.back_to_menu()
+                    return
+
+        win = self.manager.win
+        win.fill((0, 0, 0))
+        win.blit(self.text, self.text_rect)
+        self.restart_button.draw(win)
+        self.game_menu_button.draw(win)
+        self.quit_button.draw(win)
+        pygame.display.update()
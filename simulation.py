@@ -0,0 +1,274 @@
+import contextlib
+import math
+import time
+import pygame
+from racing_line import STEERING_GAIN, MAX_CORRECTION
+
+# Input bits for one car, read from the keys below.
+LEFT = 1
+RIGHT = 2
+FORWARD = 4
+BACKWARD = 8
+
+PLAYER1_KEYS = ((pygame.K_a, LEFT), (pygame.K_d, RIGHT), (pygame.K_w, FORWARD), (pygame.K_s, BACKWARD))
+PLAYER2_KEYS = ((pygame.K_LEFT, LEFT), (pygame.K_RIGHT, RIGHT), (pygame.K_UP, FORWARD), (pygame.K_DOWN, BACKWARD))
+
+
+def read_input(keys, mapping):
+    bits = 0
+    for key, bit in mapping:
+        if keys[key]:
+            bits |= bit
+    return bits
+
+
+def drive(car, bits):
+    moved = False
+
+    if bits & LEFT:
+        car.rotate(left=True)
+    if bits & RIGHT:
+        car.rotate(right=True)
+    if bits & FORWARD:
+        moved = True
+        car.move_forward()
+    if bits & BACKWARD:
+        moved = True
+        car.move_backward()
+
+    if not moved:
+        car.reduce_speed()
+
+
+class TickClock:
+    # Game time measured in simulation ticks instead of wall-clock time, so a
+    # race plays out the same however fast it is stepped.
+    def __init__(self, rate=60):
+        self.rate = rate
+        self.ticks = 0
+
+    def tick(self):
+        self.ticks += 1
+
+    def time(self):
+        return self.ticks / self.rate
+
+    def ticks_to_ms(self, ticks):
+        return ticks * 1000 // self.rate
+
+
+class Simulation:
+    # Game logic for one race with no display, wall clock or keyboard. Each step
+    # advances one tick from the input bits of every player; the windowed
+    # run() loops and headless tools drive the same code.
+    END_OUTCOMES = ()
+    PHASES = ()
+
+    def __init__(self, rate=60):
+        self.clock = TickClock(rate)
+        self.profiler = None
+        self.recorder = None
+
+    @property
+    def ticks(self):
+        return self.clock.ticks
+
+    def update(self, *inputs):
+        raise NotImplementedError
+
+    def step(self, *inputs):
+        if self.recorder:
+            self.recorder.record(inputs)
+        self.clock.tick()
+        return self.update(*inputs)
+
+    def run(self, ticks, inputs=None):
+        # inputs is called with the simulation before every tick and returns
+        # the input bits for each player; without it nobody touches the keys.
+        for _ in range(ticks):
+            outcome = self.step(*(inputs(self) if inputs else ()))
+            if outcome in self.END_OUTCOMES:
+                return outcome
+        return None
+
+
+class FixedStep:
+    # Turns the wall-clock time between frames into whole simulation ticks at
+    # a fixed rate, carrying the remainder over, so the race runs at the same
+    # speed however often frames are drawn. alpha is how far the time since
+    # the last tick is towards the next one.
+    def __init__(self, rate, max_ticks=5):
+        self.tick_time = 1 / rate
+        self.max_ticks = max_ticks
+        self.accumulator = 0.0
+        self.last = None
+
+    def reset(self):
+        # After a pause the next frame runs exactly one tick.
+        self.accumulator = 0.0
+        self.last = None
+
+    def ticks(self):
+        now = time.perf_counter()
+        elapsed = self.tick_time if self.last is None else now - self.last
+        self.last = now
+        # Catches up on at most max_ticks per frame, so a long stall slows
+        # the race down instead of running a burst of ticks.
+        self.accumulator = min(self.accumulator + elapsed, self.max_ticks * self.tick_time)
+        ticks = int(self.accumulator / self.tick_time)
+        self.accumulator -= ticks * self.tick_time
+        return ticks
+
+    @property
+    def alpha(self):
+        return self.accumulator / self.tick_time
+
+
+class Interpolation:
+    # Car positions and angles before the latest tick, so frames drawn
+    # between ticks can show the cars part way from there to where they are.
+    def __init__(self, cars):
+        self.cars = cars
+        self.save()
+
+    def save(self):
+        self.previous = [(car.x, car.y, car.angle) for car in self.cars]
+
+    @contextlib.contextmanager
+    def blend(self, alpha):
+        # Moves the cars alpha of the way from their previous pose to the
+        # current one for the duration of the block.
+        current = [(car.x, car.y, car.angle) for car in self.cars]
+        for car, (x0, y0, angle0), (x1, y1, angle1) in zip(self.cars, self.previous, current):
+            car.x = x0 + (x1 - x0) * alpha
+            car.y = y0 + (y1 - y0) * alpha
+            car.angle = angle0 + (angle1 - angle0) * alpha
+        try:
+            yield
+        finally:
+            for car, (x, y, angle) in zip(self.cars, current):
+                car.x, car.y, car.angle = x, y, angle
+
+
+class Autopilot:
+    # Scripted driver for headless races: steers the car towards each point
+    # of a path in turn with the same input bits a player would press. With
+    # a distance field it picks the heading closest to the next point that
+    # is clear of walls, and backs off when it gets stuck.
+    FAN = range(-90, 91, 15)
+
+    def __init__(self, path, field=None, reach=40, cruise_vel=4, lookahead=80):
+        self.path = path
+        self.field = field
+        self.reach = reach
+        self.cruise_vel = cruise_vel
+        self.lookahead = lookahead
+        self.current_point = 0
+        self.reversing = 0
+
+    def _clearance(self, car, x, y, angle):
+        radians = math.radians(angle)
+        radius = car.img.get_width() / 2
+        hit = self.field.raycast(x, y, -math.sin(radians), -math.cos(radians), self.lookahead, radius)
+        return self.lookahead if hit is None else hit
+
+    def __call__(self, car):
+        width, height = car.img.get_size()
+        x, y = car.x + width / 2, car.y + height / 2
+        target_x, target_y = self.path[self.current_point % len(self.path)]
+        if math.hypot(target_x - x, target_y - y) < self.reach:
+            self.current_point += 1
+            target_x, target_y = self.path[self.current_point % len(self.path)]
+
+        desired = math.degrees(math.atan2(x - target_x, y - target_y))
+        difference = (desired - car.angle + 180) % 360 - 180
+        throttle = abs(difference) < 45
+
+        if self.field is not None:
+            ahead = self._clearance(car, x, y, car.angle)
+            if ahead < height / 2 and abs(car.vel) < 1:
+                self.reversing = 20
+            if self.reversing:
+                self.reversing -= 1
+                return BACKWARD | (RIGHT if difference > 0 else LEFT)
+
+            best = None
+            for turn in self.FAN:
+                score = self._clearance(car, x, y, car.angle + turn) - abs(difference - turn) / 3
+                if best is None or score > best[0]:
+                    best = (score, turn)
+            difference = best[1]
+            throttle = ahead > height / 2 + car.vel * 4
+
+        bits = 0
+        if throttle and car.vel < self.cruise_vel:
+            bits |= FORWARD
+        if difference > car.rotation_vel / 2:
+            bits |= LEFT
+        elif difference < -car.rotation_vel / 2:
+            bits |= RIGHT
+        return bits
+
+
+class LinePilot:
+    # Scripted driver that follows a racing line the way the computer cars
+    # do, but with the input bits a player would press. When one of the
+    # other cars is in the way it steers out to whichever side of it is
+    # clear of walls to pass, so it can beat computer cars on the same line.
+    def __init__(self, line, field, others=(), passing=24, lookahead=70):
+        self.line = line
+        self.field = field
+        self.others = others
+        self.passing = passing
+        self.lookahead = lookahead
+        self.current_point = 0
+        self.offset = 0.0
+
+    def _offset(self, car, x, y, entry):
+        # Pixels to the left of the line to drive at to get past the cars
+        # ahead.
+        line_x, line_y, left_x, left_y, heading, _ = entry
+        radians = math.radians(heading)
+        forward_x, forward_y = -math.sin(radians), -math.cos(radians)
+        beside = (x - line_x) * left_x + (y - line_y) * left_y
+        offset = 0.0
+        for other in self.others:
+            width, height = other.img.get_size()
+            dx, dy = other.x + width / 2 - x, other.y + height / 2 - y
+            ahead = dx * forward_x + dy * forward_y
+            side = beside + dx * left_x + dy * left_y
+            if 0 < ahead < self.lookahead and abs(side - self.offset) < self.passing:
+                clear = [side + turn for turn in (self.passing, -self.passing)
+                         if self.field.distance(line_x + left_x * (side + turn), line_y + left_y * (side + turn)) > width / 2 + 1]
+                if clear:
+                    offset = min(clear, key=abs)
+        return offset
+
+    def __call__(self, car):
+        width, height = car.img.get_size()
+        x, y = car.x + width / 2, car.y + height / 2
+        line = self.line
+        # The line ends just before the finish line, so past its last entry
+        # the car starts a new lap or is back on the grid.
+        if self.current_point == len(line) - 1:
+            self.current_point = 0
+        self.current_point = line.advance(self.current_point, x, y)
+        entry = line.entries[self.current_point]
+        line_x, line_y, left_x, left_y, heading, speed = entry
+        self.offset = self._offset(car, x, y, entry)
+
+        beside = (x - line_x) * left_x + (y - line_y) * left_y
+        correction = max(-MAX_CORRECTION, min(MAX_CORRECTION, (beside - self.offset) * STEERING_GAIN))
+        difference = (heading - correction - car.angle + 180) % 360 - 180
+
+        bits = 0
+        target_vel = speed * car.rotation_vel
+        if car.vel < target_vel:
+            bits |= FORWARD
+        elif car.vel > target_vel + car.acceleration:
+            bits |= BACKWARD
+        if difference > car.rotation_vel / 2:
+            bits |= LEFT
+        elif difference < -car.rotation_vel / 2:
+            bits |= RIGHT
+        return bits
@@ -0,0 +1,153 @@
+import struct
+import sys
+from array import array
+from spatial import UniformGrid
+
+# Binary snapshots of a race: every car, the collectibles and the level and
+# timer, small enough to take every tick. A snapshot is a header followed by
+# the car doubles, the car path indices and a bitmask of collected
+# collectibles, all little-endian. The collectible layout itself is rebuilt
+# from the seed and level, so only the collected flags are stored.
+
+MAGIC = b"RS"
+VERSION = 3
+# magic, version, cars, collectibles, started, seed, tick, level, level start tick
+HEADER = struct.Struct("<2sBBBBIIHI")
+# cruise_vel and on_grid only exist on computer cars and are stored as 0 for
+# the others.
+CAR_FIELDS = ("x", "y", "angle", "vel", "max_vel", "speed_multiplier", "effect_end_time", "cruise_vel", "on_grid")
+
+# A delta holds the runs of bytes that changed since a base snapshot of the
+# same size: a header, then (offset, length) followed by the new bytes for
+# each run. Runs closer than MERGE_GAP bytes are merged.
+DELTA_MAGIC = b"RD"
+DELTA_HEADER = struct.Struct("<2sBH")
+DELTA_RUN = struct.Struct("<HB")
+MERGE_GAP = 4
+
+_SWAP = sys.byteorder != "little"
+
+
+def _to_bytes(values):
+    if _SWAP:
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if _SWAP:
+        values.byteswap()
+    return values
+
+
+def take(race):
+    game_info = race.game_info
+    cars = race.cars
+    collectibles = game_info.collectibles
+
+    doubles = array("d", [getattr(car, field, 0.0) for car in cars for field in CAR_FIELDS])
+    path_indices = array("i", [getattr(car, "current_point", -1) for car in cars])
+    collected = 0
+    for i, collectible in enumerate(collectibles):
+        if collectible.collected:
+            collected |= 1 << i
+
+    header = HEADER.pack(MAGIC, VERSION, len(cars), len(collectibles), game_info.started, game_info.seed,
+                         race.clock.ticks, game_info.level, game_info.level_start_tick)
+    return (header + _to_bytes(doubles) + _to_bytes(path_indices)
+            + collected.to_bytes((len(collectibles) + 7) // 8, "little"))
+
+
+def restore(race, data):
+    # Puts the race back in the snapshotted state, in place.
+    magic, version, car_count, collectible_count, started, seed, tick, level, level_start_tick = \
+        HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not a version {VERSION} race snapshot")
+    cars = race.cars
+    if car_count != len(cars):
+        raise ValueError(f"snapshot has {car_count} cars, the race has {len(cars)}")
+
+    offset = HEADER.size
+    size = car_count * len(CAR_FIELDS) * 8
+    doubles = _from_bytes("d", data[offset:offset + size])
+    offset += size
+    path_indices = _from_bytes("i", data[offset:offset + car_count * 4])
+    offset += car_count * 4
+    collected = int.from_bytes(data[offset:offset + (collectible_count + 7) // 8], "little")
+
+    fields = len(CAR_FIELDS)
+    for i, car in enumerate(cars):
+        for j, field in enumerate(CAR_FIELDS):
+            if hasattr(car, field):
+                setattr(car, field, doubles[i * fields + j])
+        if path_indices[i] >= 0:
+            car.current_point = path_indices[i]
+        if hasattr(car, "rect"):
+            car.rect.center = (car.x, car.y)
+
+    race.clock.ticks = tick
+    race.seed = seed
+    game_info = race.game_info
+    game_info.started = bool(started)
+    game_info.level_start_tick = level_start_tick
+    if game_info.seed != seed or game_info.level != level:
+        game_info.seed = seed
+        game_info.level = level
+        game_info.spawn_collectibles()
+
+    changed = False
+    for i, collectible in enumerate(game_info.collectibles):
+        was_collected = collectible.collected
+        collectible.collected = bool(collected >> i & 1)
+        changed = changed or collectible.collected != was_collected
+    if changed:
+        # Rebuilt in list order so collectibles are queried in the same order
+        # as before.
+        game_info.collectible_grid = UniformGrid()
+        for collectible in game_info.collectibles:
+            if not collectible.collected:
+                game_info.collectible_grid.insert(collectible, collectible.rect)
+
+
+def encode_delta(base, snapshot):
+    # Falls back to the full snapshot when the sizes differ.
+    if len(base) != len(snapshot):
+        return snapshot
+    runs = []
+    i, size = 0, len(snapshot)
+    while i < size:
+        if base[i] == snapshot[i]:
+            i += 1
+            continue
+        start = end = i
+        while i < size and i - end <= MERGE_GAP and i - start < 255:
+            if base[i] != snapshot[i]:
+                end = i
+            i += 1
+        runs.append((start, end + 1))
+        i = end + 1
+
+    parts = [DELTA_HEADER.pack(DELTA_MAGIC, VERSION, len(runs))]
+    for start, end in runs:
+        parts.append(DELTA_RUN.pack(start, end - start))
+        parts.append(snapshot[start:end])
+    return b"".join(parts)
+
+
+def apply_delta(base, delta):
+    if delta[:2] != DELTA_MAGIC:
+        return delta
+    _, version, count = DELTA_HEADER.unpack_from(delta)
+    if version != VERSION:
+        raise ValueError(f"not a version {VERSION} snapshot delta")
+    snapshot = bytearray(base)
+    offset = DELTA_HEADER.size
+    for _ in range(count):
+        start, length = DELTA_RUN.unpack_from(delta, offset)
+        offset += DELTA_RUN.size
+        snapshot[start:start + length] = delta[offset:offset + length]
+        offset += length
+    return bytes(snapshot)
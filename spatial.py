@@ -0,0 +1,65 @@
+class UniformGrid:
+    # Buckets items by the grid cells their bounding rect overlaps, so a query
+    # only looks at items near the queried rect instead of all of them.
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.rects = {}
+        self.order = {}
+        self._next = 0
+
+    def __len__(self):
+        return len(self.rects)
+
+    def __contains__(self, item):
+        return item in self.rects
+
+    def _cells(self, rect):
+        size = self.cell_size
+        for cx in range(rect.left // size, (rect.right - 1) // size + 1):
+            for cy in range(rect.top // size, (rect.bottom - 1) // size + 1):
+                yield cx, cy
+
+    def insert(self, item, rect):
+        self.rects[item] = rect
+        self.order[item] = self._next
+        self._next += 1
+        for cell in self._cells(rect):
+            self.cells.setdefault(cell, []).append(item)
+
+    def remove(self, item):
+        rect = self.rects.pop(item, None)
+        if rect is None:
+            return
+        del self.order[item]
+        for cell in self._cells(rect):
+            bucket = self.cells[cell]
+            bucket.remove(item)
+            if not bucket:
+                del self.cells[cell]
+
+    def query(self, rect):
+        # Items whose rect overlaps rect, in insertion order.
+        found = set()
+        for cell in self._cells(rect):
+            for item in self.cells.get(cell, ()):
+                if item not in found and self.rects[item].colliderect(rect):
+                    found.add(item)
+        return sorted(found, key=self.order.__getitem__)
+
+
+def sweep_and_prune(boxes):
+    # Broad phase: index pairs (i, j), i < j, of the (left, top, right, bottom)
+    # boxes that overlap. Boxes are swept left to right, and each one is only
+    # tested against the boxes whose x extent it still overlaps.
+    order = sorted(range(len(boxes)), key=lambda i: boxes[i][0])
+    pairs = []
+    active = []
+    for i in order:
+        left, top, right, bottom = boxes[i]
+        active = [j for j in active if boxes[j][2] > left]
+        for j in active:
+            if boxes[j][1] < bottom and top < boxes[j][3]:
+                pairs.append((j, i) if j < i else (i, j))
+        active.append(i)
+    return pairs
@@ -0,0 +1,128 @@
+import argparse
+import csv
+import itertools
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+from track import DEFAULT_TRACK, get_track, track_names
+from vs_computer import ComputerCar, GameInfo, FPS, pick_up_collectibles
+
+# Runs headless races of the computer car alone for every combination of
+# ComputerCar settings and reports how each one does on every level. Each
+# configuration is one task for a process pool.
+
+MAX_TICKS = 60 * FPS
+COLUMNS = ["max_vel", "rotation_vel", "level_speedup"]
+
+
+def run_level(track, max_vel, rotation_vel, level_speedup, level, seed):
+    game_info = GameInfo(level=level, seed=seed, path=track.path)
+    car = ComputerCar(max_vel, rotation_vel, track.starts[1], track.racing_line)
+    car.LEVEL_SPEEDUP = level_speedup
+    car.next_level(level)
+    game_info.start_level()
+
+    wall_hits = boosts = slowers = 0
+    touching_wall = False
+    for _ in range(MAX_TICKS):
+        game_info.clock.tick()
+        car.move()
+        for _, collectible in pick_up_collectibles((car,), game_info):
+            if collectible.is_boost:
+                boosts += 1
+            else:
+                slowers += 1
+        hits = car.hits_wall(track.border_field)
+        wall_hits += hits and not touching_wall
+        touching_wall = hits
+        if car.collide(track.finish_mask, *track.finish_position) is not None:
+            return game_info.get_level_time_ms(), wall_hits, boosts, slowers
+    return None, wall_hits, boosts, slowers
+
+
+def run_config(config):
+    track_name, max_vel, rotation_vel, level_speedup, seeds = config
+    track = get_track(track_name)
+    row = {"max_vel": max_vel, "rotation_vel": rotation_vel, "level_speedup": level_speedup}
+    totals = {"wall_hits": 0, "boosts": 0, "slowers": 0, "unfinished": 0}
+    for level in range(1, GameInfo.LEVELS + 1):
+        times = []
+        for seed in seeds:
+            lap_ms, wall_hits, boosts, slowers = run_level(track, max_vel, rotation_vel, level_speedup, level, seed)
+            totals["wall_hits"] += wall_hits
+            totals["boosts"] += boosts
+            totals["slowers"] += slowers
+            if lap_ms is None:
+                totals["unfinished"] += 1
+            else:
+                times.append(lap_ms)
+        row[f"level{level}_s"] = round(sum(times) / len(times) / 1000, 2) if times else None
+    finished = [row[f"level{level}_s"] for level in range(1, GameInfo.LEVELS + 1)]
+    row["total_s"] = round(sum(finished), 2) if None not in finished else None
+    row.update(totals)
+    return row
+
+
+def grid_configs(args):
+    return list(itertools.product(args.max_vel, args.rotation_vel, args.level_speedup))
+
+
+def random_configs(args):
+    rng = random.Random(args.seed)
+    return [(round(rng.uniform(min(args.max_vel), max(args.max_vel)), 2),
+             round(rng.uniform(min(args.rotation_vel), max(args.rotation_vel)), 2),
+             round(rng.uniform(min(args.level_speedup), max(args.level_speedup)), 3))
+            for _ in range(args.random)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep computer car settings over headless races.")
+    parser.add_argument("--max-vel", type=float, nargs="+", default=[1.5, 2, 2.5])
+    parser.add_argument("--rotation-vel", type=float, nargs="+", default=[3, 4, 5])
+    parser.add_argument("--level-speedup", type=float, nargs="+", default=[0.04, 0.08, 0.12])
+    parser.add_argument("--random", type=int, metavar="N",
+                        help="sample N configurations between the lowest and highest values given instead of the grid")
+    parser.add_argument("--seeds", type=int, default=3, help="collectible layouts per level")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--track", choices=track_names(), default=DEFAULT_TRACK)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default="sweep.csv")
+    args = parser.parse_args(argv)
+
+    configs = random_configs(args) if args.random else grid_configs(args)
+    seeds = list(range(args.seed, args.seed + args.seeds))
+    tasks = [(args.track,) + config + (seeds,) for config in configs]
+    print(f"{len(tasks)} configurations x {GameInfo.LEVELS} levels x {len(seeds)} seeds on {args.workers} workers")
+
+    # Builds the disk caches once up front instead of in every worker at once.
+    get_track(args.track).preload()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as executor:
+        rows = list(executor.map(run_config, tasks))
+    elapsed = time.perf_counter() - start
+
+    fields = COLUMNS + [f"level{level}_s" for level in range(1, GameInfo.LEVELS + 1)] + \
+        ["total_s", "wall_hits", "boosts", "slowers", "unfinished"]
+    with open(args.output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    rows.sort(key=lambda row: (row["total_s"] is None, row["total_s"] or 0))
+    print(f"{'max_vel':>8} {'rot_vel':>8} {'speedup':>8} {'level1':>8} {'level10':>8} {'total':>8} "
+          f"{'walls':>6} {'boosts':>6} {'unfin':>6}")
+    for row in rows:
+        print(f"{row['max_vel']:>8} {row['rotation_vel']:>8} {row['level_speedup']:>8} "
+              f"{row['level1_s'] or '-':>8} {row['level10_s'] or '-':>8} {row['total_s'] or '-':>8} "
+              f"{row['wall_hits']:>6} {row['boosts']:>6} {row['unfinished']:>6}")
+    print(f"Finished in {elapsed:.1f}s; results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,222 @@
+import glob
+import hashlib
+import json
+import os
+import time
+import zipfile
+from functools import cached_property
+import numpy as np
+import pygame
+import racing_line
+from assets import load_image, cache_image, has_image
+from distance_field import MAX_DISTANCE, DistanceField
+from racing_line import RacingLine
+from utils import scale_image, atomic_write
+
+TRACK_DIR = "tracks"
+DEFAULT_TRACK = "default"
+CACHE_DIR = ".cache"
+# Bump when the preprocessed artifacts change shape or meaning.
+VERSION = 2
+LAYERS = ("grass", "track", "border", "finish")
+
+
+class Track:
+    # A track described by a manifest: its images and their scales, where
+    # the finish line goes, where the two cars start, the grid the other
+    # computer cars line up on and the waypoints collectibles are placed on.
+    #
+    # Everything derived from the images (the scaled surfaces, the border
+    # distance field, the racing line and the grid spawns) is built once and
+    # cached in one file, keyed by a hash of the manifest and the source
+    # images, so later loads only read that file. Nothing is loaded until it
+    # is first used, and every mode shares one instance per track through
+    # get_track, so importing a mode costs nothing and switching modes loads
+    # nothing twice.
+    def __init__(self, manifest, cache_dir=CACHE_DIR):
+        self.manifest = manifest
+        self.name = manifest["name"]
+        self.cache_dir = cache_dir
+        self.grass_image = (manifest["grass"]["image"], manifest["grass"]["scale"])
+        self.track_image = (manifest["track"]["image"], manifest["track"]["scale"])
+        self.border_image = (manifest["border"]["image"], manifest["border"]["scale"])
+        self.finish_image = (manifest["finish"]["image"], manifest["finish"]["scale"])
+        self.finish_position = tuple(manifest["finish"]["position"])
+        self.starts = [tuple(start) for start in manifest["starts"]]
+        self.path = [tuple(point) for point in manifest["path"]]
+
+    @classmethod
+    def load(cls, path, cache_dir=CACHE_DIR):
+        with open(path) as f:
+            return cls(json.load(f), cache_dir)
+
+    @cached_property
+    def digest(self):
+        digest = hashlib.sha1(json.dumps(self.manifest, sort_keys=True).encode())
+        digest.update(repr((VERSION, MAX_DISTANCE) + racing_line.SETTINGS).encode())
+        for layer in LAYERS:
+            with open(self.manifest[layer]["image"], "rb") as f:
+                digest.update(f.read())
+        return digest.hexdigest()
+
+    def _build(self):
+        artifacts = {}
+        surfaces = {}
+        for layer in LAYERS:
+            surface = pygame.image.load(self.manifest[layer]["image"])
+            scale = self.manifest[layer]["scale"]
+            if scale != 1:
+                surface = scale_image(surface, scale)
+            surfaces[layer] = surface
+            pixels = np.frombuffer(pygame.image.tobytes(surface, "RGBA"), dtype=np.uint8)
+            artifacts[f"{layer}_pixels"] = pixels.reshape(surface.get_height(), surface.get_width(), 4)
+
+        field = DistanceField.from_mask(pygame.mask.from_surface(surfaces["border"]))
+        line = racing_line.plan(field, surfaces["finish"].get_rect(topleft=self.finish_position))
+        artifacts.update(distance=field.distance_array, gradient_x=field.gradient_x, gradient_y=field.gradient_y,
+                         line_positions=line.positions, line_headings=line.headings, line_speeds=line.speeds,
+                         spawns=np.array(self._spawns(line), dtype=np.float64))
+        return artifacts
+
+    def _spawns(self, line):
+        # Centers, headings and racing line entries of the grid slots, front
+        # row first. Rows are counted back from the end of the racing line,
+        # so the grid is behind the finish line and the starting cars.
+        grid = self.manifest["grid"]
+        spawns = []
+        for row in range(grid["rows"]):
+            i = max(len(line) - 1 - (row + grid["first_row"]) * grid["row_spacing"], 0)
+            x, y, left_x, left_y, heading, _ = line.entries[i]
+            for offset in grid["lanes"]:
+                spawns.append((x + left_x * offset, y + left_y * offset, heading, i))
+        return spawns
+
+    @cached_property
+    def artifacts(self):
+        path = os.path.join(self.cache_dir, f"track-{self.name}-{self.digest}.npz")
+        # Arrays are read from the file when first used, so the layer pixels
+        # are never read when the asset bundle already has the layers. A file
+        # that can't be read is rebuilt like a missing one.
+        try:
+            return np.load(path)
+        except (OSError, EOFError, ValueError, zipfile.BadZipFile):
+            pass
+        with atomic_write(path) as f:
+            _save(f, self._build())
+        self._remove_stale_caches(path)
+        return np.load(path)
+
+    def _remove_stale_caches(self, path):
+        # Caches of older versions of this track.
+        pattern = f"track-{self.name}-{'[0-9a-f]' * 40}.npz"
+        for stale in glob.glob(os.path.join(self.cache_dir, pattern)):
+            if stale != path:
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+    def _layer(self, layer):
+        path, factor = getattr(self, f"{layer}_image")
+        # The scaled images go into the asset cache, where they get converted
+        # to the display format like any other image.
+        if not has_image(path, factor):
+            pixels = self.artifacts[f"{layer}_pixels"]
+            height, width, _ = pixels.shape
+            cache_image(path, factor, pygame.image.frombytes(pixels.tobytes(), (width, height), "RGBA"))
+        return load_image(path, factor)
+
+    @property
+    def grass(self):
+        return self._layer("grass")
+
+    @property
+    def track(self):
+        return self._layer("track")
+
+    @property
+    def border(self):
+        return self._layer("border")
+
+    @property
+    def finish(self):
+        return self._layer("finish")
+
+    @cached_property
+    def size(self):
+        return self.track.get_size()
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    @cached_property
+    def finish_mask(self):
+        return pygame.mask.from_surface(self.finish)
+
+    @cached_property
+    def border_field(self):
+        artifacts = self.artifacts
+        return DistanceField(artifacts["distance"], artifacts["gradient_x"], artifacts["gradient_y"])
+
+    @cached_property
+    def racing_line(self):
+        artifacts = self.artifacts
+        return RacingLine(artifacts["line_positions"], artifacts["line_headings"], artifacts["line_speeds"])
+
+    @cached_property
+    def spawns(self):
+        # (x, y, heading, racing line index) of every grid slot.
+        return [(x, y, heading, int(i)) for x, y, heading, i in self.artifacts["spawns"].tolist()]
+
+    def layers(self):
+        return [(self.grass, (0, 0)), (self.track, (0, 0)),
+                (self.finish, self.finish_position), (self.border, (0, 0))]
+
+    def preload(self):
+        # Builds everything up front, e.g. before the first frame of a race.
+        # Returns the time it took in seconds.
+        start = time.perf_counter()
+        self.layers()
+        self.border_field
+        self.finish_mask
+        self.racing_line
+        self.spawns
+        return time.perf_counter() - start
+
+
+def _save(f, artifacts):
+    # Writes an npz file like np.savez, but with only the layer pixels
+    # compressed: they are just read without an asset bundle, while the
+    # rest is read on every start and loads faster stored as it is.
+    with zipfile.ZipFile(f, "w", allowZip64=True) as archive:
+        for name, array in artifacts.items():
+            info = zipfile.ZipInfo(f"{name}.npy")
+            info.compress_type = zipfile.ZIP_DEFLATED if name.endswith("_pixels") else zipfile.ZIP_STORED
+            with archive.open(info, "w", force_zip64=True) as entry:
+                np.lib.format.write_array(entry, np.asanyarray(array), allow_pickle=False)
+
+
+_TRACKS = {}
+
+
+def track_names():
+    # Every track with a manifest in TRACK_DIR.
+    return sorted(os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(TRACK_DIR, "*.json")))
+
+
+def get_track(name=DEFAULT_TRACK):
+    track = _TRACKS.get(name)
+    if track is None:
+        path = os.path.join(TRACK_DIR, f"{name}.json")
+        track = Track.load(path)
+        # Replays and network races refer to a track by its name, which has
+        # to find the same manifest again.
+        if track.name != name:
+            raise ValueError(f"{path} is named {track.name!r}, not {name!r}")
+        _TRACKS[name] = track
+    return track
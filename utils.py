@@ -1,3 +1,6 @@
+import os
+import tempfile
+from contextlib import contextmanager
 import pygame
 
 
@@ -16,4 +19,40 @@ def blit_rotate_center(win, image, top_left, angle):
 def blit_text_center(win, font, text):
     render = font.render(text, 1, (200, 200, 200))
     win.blit(render, (win.get_width()/2 - render.get_width() /
-                      2, win.get_height()/2 - render.get_height()/2))
\ No newline at end of file
+                      2, win.get_height()/2 - render.get_height()/2))
+
+
+# Frame-rate cap for menus and waiting screens, which only redraw when
+# something happens. Set it before opening a screen to change it.
+IDLE_FPS = 20
+
+
+def wait_events(idle_fps=None):
+    # Sleeps until an event arrives or one idle frame has passed, then returns
+    # every pending event: an empty list means nothing happened.
+    event = pygame.event.wait(1000 // (idle_fps or IDLE_FPS))
+    if event.type == pygame.NOEVENT:
+        return []
+    return [event] + pygame.event.get()
+
+
+@contextmanager
+def atomic_write(path):
+    # Yields a file to write instead of path, which it replaces only once
+    # the file is complete. An interrupted write, or another process
+    # reading at the same time, never sees half a file. The file gets the
+    # permissions open() would give it, not mkstemp's owner-only ones, so
+    # other users can read caches baked by a build user.
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_path, 0o666 & ~umask)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
@@ -1,35 +1,38 @@
 import pygame
-import time
 import math
 import random
-from utils import scale_image, blit_rotate_center, blit_text_center
-import game_selection_menu
-
-pygame.font.init()
-
-GRASS = scale_image(pygame.image.load("imgs/grass.jpg"), 2.5)
-TRACK = scale_image(pygame.image.load("imgs/track.png"), 0.9)
-TRACK_BORDER = scale_image(pygame.image.load("imgs/track-border.png"), 0.9)
-TRACK_BORDER_MASK = pygame.mask.from_surface(TRACK_BORDER)
-FINISH = pygame.image.load("imgs/finish.png")
-FINISH_MASK = pygame.mask.from_surface(FINISH)
-FINISH_POSITION = (130, 250)
-RED_CAR = scale_image(pygame.image.load("imgs/red-car.png"), 0.55)
-GREEN_CAR = scale_image(pygame.image.load("imgs/green-car.png"), 0.55)
-
-WIDTH, HEIGHT = TRACK.get_width(), TRACK.get_height()
-WIN = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Racing Game!")
+import sys
+import time
+from assets import load_image, load_rotations
+from hud import Hud
+from track import DEFAULT_TRACK, get_track
+from racing_line import STEERING_GAIN, MAX_CORRECTION
+from spatial import UniformGrid
+from collision import collide_cars, collide_wall, wall_capsule
+from car_batch import CarBatch
+from simulation import Simulation, TickClock, PLAYER1_KEYS, read_input, drive
+import scenes
+from scenes import SceneManager
+
+CAR_SCALE = 0.55
+MAX_OPPONENTS = 64
+RED_CAR = "imgs/red-car.png"
+GREEN_CAR = "imgs/green-car.png"
+BOOST_IMG = "imgs/booster-green.svg"
+SLOWER_IMG = "imgs/slower.png"
+
+HUD = Hud("comicsans", 44)
+
+# Simulation ticks per second. Speeds are in pixels per tick, and frames are
+# drawn at their own rate in between.
+FPS = 60
 
-MAIN_FONT = pygame.font.SysFont("comicsans", 44)
 
-FPS = 60
-PATH = [(175, 119),
-        (110, 70), (56, 133), (70, 481), (318, 731), (404, 680), (418, 521), (507, 475), (600, 551),
-        (613, 715),
-        (736, 713), (734, 399), (611, 357), (409, 343), (433, 257), (697, 258), (738, 123), (581, 71), (303, 78),
-        (275, 377),
-        (176, 388), (178, 260)]
+def collect_rect(car):
+    return pygame.Rect(car.x - car.img.get_width() / 2,
+                       car.y - car.img.get_height() / 2,
+                       car.img.get_width(),
+                       car.img.get_height())
 
 
 class Collectible:
@@ -41,119 +44,92 @@ class Collectible:
         self.radius = 15
         self.effect_duration = 3
         self.speed_multiplier = 1.5 if is_boost else 0.5
+        self.img_path = BOOST_IMG if is_boost else SLOWER_IMG
+        self.rect = pygame.Rect(x - self.radius, y - self.radius, self.radius * 2, self.radius * 2)
 
     def draw(self, win):
         if not self.collected:
-            img_path = "imgs/booster-green.svg" if self.is_boost else "imgs/slower.png"
-            image = pygame.image.load(img_path)
-            win.blit(image, (self.x, self.y))
+            win.blit(load_image(self.img_path), (self.x, self.y))
 
-    def collect(self, car):
+    def collect(self, car, car_rect=None):
         if not self.collected:
-            car_rect = pygame.Rect(car.x - car.img.get_width() / 2,
-                                   car.y - car.img.get_height() / 2,
-                                   car.img.get_width(),
-                                   car.img.get_height())
-            collectible_rect = pygame.Rect(self.x - self.radius,
-                                           self.y - self.radius,
-                                           self.radius * 2,
-                                           self.radius * 2)
-            if car_rect.colliderect(collectible_rect):
+            if car_rect is None:
+                car_rect = collect_rect(car)
+            if car_rect.colliderect(self.rect):
                 self.collected = True
                 return True
         return False
 
-class Button:
-    def __init__(self, x, y, width, height, text, color=(100, 100, 100),action=None):
-        self.rect = pygame.Rect(x, y, width, height)
-        self.text = text
-        self.color = color
-        self.font = pygame.font.SysFont("comicsans", 30)
-        self.action = action
 
-    def draw(self, win):
-        pygame.draw.rect(win, self.color, self.rect)
-        text_surface = self.font.render(self.text, True, (255, 255, 255))
-        text_rect = text_surface.get_rect(center=self.rect.center)
-        win.blit(text_surface, text_rect)
 
-    def is_clicked(self, pos):
-        return self.rect.collidepoint(pos)
 class GameInfo:
     LEVELS = 10
+    COLLECTIBLES = 6
 
-    def __init__(self, level=1):
+    def __init__(self, level=1, clock=None, seed=None, path=None):
+        self.clock = clock or TickClock(FPS)
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        # The track's waypoints collectibles are placed on.
+        self.path = get_track().path if path is None else path
         self.level = level
         self.started = False
-        self.level_start_time = 0
-        self.collectibles = []
-        # self.generate_collectibles()
-        random_positions = random.sample(PATH, 6)
-
-        self.collectibles = [
-            Collectible(random_positions[0][0], random_positions[0][1], True),  # Boost
-            Collectible(random_positions[1][0], random_positions[1][1], False),  # Slower
-            Collectible(random_positions[2][0], random_positions[2][1], True),  # Boost
-            Collectible(random_positions[3][0], random_positions[3][1], False),  # Slower
-            Collectible(random_positions[4][0], random_positions[4][1], True),  # Boost
-            Collectible(random_positions[5][0], random_positions[5][1], False)  # Slower
-        ]
+        self.level_start_tick = 0
+        # Milliseconds each finished level took, shown on the HUD.
+        self.lap_times = []
+        self.spawn_collectibles()
 
     def next_level(self):
+        self.lap_times.append(self.get_level_time_ms())
         self.level += 1
         self.started = False
-
-        random_positions = random.sample(PATH, 6)
-
-        self.collectibles = [
-            Collectible(random_positions[0][0], random_positions[0][1], True),
-            Collectible(random_positions[1][0], random_positions[1][1], False),
-            Collectible(random_positions[2][0], random_positions[2][1], True),
-            Collectible(random_positions[3][0], random_positions[3][1], False),  # Slower
-            Collectible(random_positions[4][0], random_positions[4][1], True),  # Boost
-            Collectible(random_positions[5][0], random_positions[5][1], False)  # Slower
-        ]
+        self.spawn_collectibles()
 
     def reset(self):
         self.level = 1
         self.started = False
-        self.level_start_time = 0
-        random_positions = random.sample(PATH, 6)
-
-        self.collectibles = [
-            Collectible(random_positions[0][0], random_positions[0][1], True),  # Boost
-            Collectible(random_positions[1][0], random_positions[1][1], False),  # Slower
-            Collectible(random_positions[2][0], random_positions[2][1], True),  # Boost
-            Collectible(random_positions[3][0], random_positions[3][1], False),  # Slower
-            Collectible(random_positions[4][0], random_positions[4][1], True),  # Boost
-            Collectible(random_positions[5][0], random_positions[5][1], False)  # Slower
-        ]
-
+        self.level_start_tick = 0
+        self.lap_times = []
+        self.spawn_collectibles()
+
+    def spawn_collectibles(self):
+        # Boosts and slowers alternate. The layout only depends on the seed and
+        # the level, so a restored snapshot can rebuild it.
+        rng = random.Random(self.seed * (self.LEVELS + 1) + self.level)
+        random_positions = rng.sample(self.path, self.COLLECTIBLES)
+        self.collectibles = [Collectible(x, y, i % 2 == 0) for i, (x, y) in enumerate(random_positions)]
+        self.collectible_grid = UniformGrid()
+        for collectible in self.collectibles:
+            self.collectible_grid.insert(collectible, collectible.rect)
 
     def game_finished(self):
         return self.level > self.LEVELS
 
     def start_level(self):
         self.started = True
-        self.level_start_time = time.time()
+        self.level_start_tick = self.clock.ticks
 
     def get_level_time(self):
+        return round(self.get_level_time_ms() / 1000)
+
+    def get_level_time_ms(self):
         if not self.started:
             return 0
-        return round(time.time() - self.level_start_time)
+        return self.clock.ticks_to_ms(self.clock.ticks - self.level_start_tick)
 
 
 class AbstractCar:
-    def __init__(self, max_vel, rotation_vel):
-        self.img = self.IMG
+    def __init__(self, max_vel, rotation_vel, start_pos):
+        self.img = load_image(self.IMG, CAR_SCALE)
+        self.rotations = load_rotations(self.IMG, CAR_SCALE)
         self.max_vel = max_vel
         self.base_max_vel = max_vel
         self.vel = 0
         self.rotation_vel = rotation_vel
         self.angle = 0
-        self.x, self.y = self.START_POS
+        self.start_pos = start_pos
+        self.x, self.y = start_pos
         self.acceleration = 0.1
-        self.power_up_end_time = 0
+        self.effect_end_time = 0
         self.speed_multiplier = 1.0
 
     def rotate(self, left=False, right=False):
@@ -163,7 +139,8 @@ class AbstractCar:
             self.angle -= self.rotation_vel
 
     def draw(self, win):
-        blit_rotate_center(win, self.img, (self.x, self.y), self.angle)
+        image, offset, _ = self.rotations.get(self.angle)
+        win.blit(image, (self.x + offset[0], self.y + offset[1]))
 
     def move_forward(self):
         self.vel = min(self.vel + self.acceleration, self.max_vel)
@@ -180,26 +157,29 @@ class AbstractCar:
         self.y -= vertical
         self.x -= horizontal
 
+    def hits_wall(self, field):
+        # The car is treated as a capsule along its heading, as wide as the car.
+        return field.hits_capsule(*wall_capsule(self, self.x, self.y))
+
     def collide(self, mask, x=0, y=0):
-        car_mask = pygame.mask.from_surface(self.img)
-        offset = (int(self.x - x), int(self.y - y))
+        _, offset, car_mask = self.rotations.get(self.angle)
+        offset = (int(self.x + offset[0] - x), int(self.y + offset[1] - y))
         poi = mask.overlap(car_mask, offset)
         return poi
 
     def update_speed_effects(self, current_time):
-        if current_time >= self.power_up_end_time:
+        if current_time >= self.effect_end_time:
             self.speed_multiplier = 1.0
             self.max_vel = self.base_max_vel
 
-    def apply_speed_effect(self, multiplier, duration):
+    def apply_speed_effect(self, multiplier, duration, current_time):
         self.speed_multiplier = multiplier
         self.max_vel = self.base_max_vel * multiplier
-        self.power_up_end_time = time.time() + duration
+        self.effect_end_time = current_time + duration
 
 
 class PlayerCar(AbstractCar):
     IMG = RED_CAR
-    START_POS = (180, 200)
 
     def reduce_speed(self):
         self.vel = max(self.vel - self.acceleration / 2, 0)
@@ -210,7 +190,7 @@ class PlayerCar(AbstractCar):
         self.move()
 
     def reset(self):
-        self.x, self.y = self.START_POS
+        self.x, self.y = self.start_pos
         self.angle = 0
         self.vel = 0
         self.speed_multiplier = 1.0
@@ -219,239 +199,276 @@ class PlayerCar(AbstractCar):
 
 class ComputerCar(AbstractCar):
     IMG = GREEN_CAR
-    START_POS = (150, 200)
-
-    def __init__(self, max_vel, rotation_vel, path=[]):
-        super().__init__(max_vel, rotation_vel)
-        self.path = path
+    # Cruise speed added per level. The racing line makes the car fast, so
+    # this stays small enough that a well driven player car still wins
+    # level 10.
+    LEVEL_SPEEDUP = 0.08
+
+    def __init__(self, max_vel, rotation_vel, start_pos, line, lateral_offset=0.0, cornering=1.0):
+        super().__init__(max_vel, rotation_vel, start_pos)
+        self.line = line
+        # Pixels to the left of the racing line this car drives, and the
+        # share of the line's target speed it dares to take corners at.
+        self.lateral_offset = lateral_offset
+        self.cornering = cornering
+        self.half_width, self.half_height = self.img.get_width() / 2, self.img.get_height() / 2
         self.current_point = 0
+        # Set while the car is on the grid behind the finish line: its first
+        # pass over the finish starts its lap instead of ending the race.
+        self.on_grid = False
+        self.cruise_vel = max_vel
         self.vel = max_vel
 
     def draw_points(self, win):
-        for point in self.path:
-            pygame.draw.circle(win, (255, 0, 0), point, 5)
+        for x, y in zip(self.line.xs[::8], self.line.ys[::8]):
+            pygame.draw.circle(win, (255, 0, 0), (x, y), 2)
 
     def draw(self, win):
         super().draw(win)
 
-    def calculate_angle(self):
-        target_x, target_y = self.path[self.current_point]
-        x_diff = target_x - self.x
-        y_diff = target_y - self.y
-
-        if y_diff == 0:
-            desired_radian_angle = math.pi / 2
-        else:
-            desired_radian_angle = math.atan(x_diff / y_diff)
-
-        if target_y > self.y:
-            desired_radian_angle += math.pi
-
-        difference_in_angle = self.angle - math.degrees(desired_radian_angle)
-        if difference_in_angle >= 180:
-            difference_in_angle -= 360
-
-        if difference_in_angle > 0:
-            self.angle -= min(self.rotation_vel, abs(difference_in_angle))
-        else:
-            self.angle += min(self.rotation_vel, abs(difference_in_angle))
-
-    def update_path_point(self):
-        target = self.path[self.current_point]
-        rect = pygame.Rect(self.x, self.y, self.img.get_width(), self.img.get_height())
-        if rect.collidepoint(*target):
-            self.current_point += 1
+    def steer(self):
+        # Moves to the nearest racing line entry ahead, turns towards its
+        # heading, corrected for how far the car's center is to the side of
+        # the line, and slows to its target speed.
+        line = self.line
+        xs, ys = line.xs, line.ys
+        x, y = self.x + self.half_width, self.y + self.half_height
+        # The line ends just before the finish line, so past its last entry
+        # the car starts its lap at the first.
+        if self.current_point == len(xs) - 1:
+            self.current_point = 0
+        i = self.current_point = line.advance(self.current_point, x, y)
+
+        _, _, left_x, left_y, heading, speed = line.entries[i]
+        correction = ((x - xs[i]) * left_x + (y - ys[i]) * left_y - self.lateral_offset) * STEERING_GAIN
+        if correction > MAX_CORRECTION:
+            correction = MAX_CORRECTION
+        elif correction < -MAX_CORRECTION:
+            correction = -MAX_CORRECTION
+        difference = (heading - correction - self.angle + 180) % 360 - 180
+        rotation_vel = self.rotation_vel
+        if difference > rotation_vel:
+            difference = rotation_vel
+        elif difference < -rotation_vel:
+            difference = -rotation_vel
+        self.angle += difference
+
+        vel = speed * rotation_vel * self.cornering
+        cruise = self.cruise_vel * self.speed_multiplier
+        self.vel = cruise if cruise < vel else vel
 
     def reset(self):
-        self.x, self.y = self.START_POS
+        self.x, self.y = self.start_pos
         self.angle = 0
         self.vel = 0
         self.speed_multiplier = 1.0
         self.max_vel = self.base_max_vel
+        self.cruise_vel = self.base_max_vel
         self.current_point = 0
+        self.on_grid = False
 
     def move(self):
-        if self.current_point >= len(self.path):
-            return
-
-        self.calculate_angle()
-        self.update_path_point()
+        self.steer()
         super().move()
 
     def next_level(self, level):
         self.reset()
-        self.vel = self.max_vel + (level - 1) * 0.4
+        self.cruise_vel = self.max_vel + (level - 1) * self.LEVEL_SPEEDUP
+        self.vel = self.cruise_vel
         self.current_point = 0
 
 
-def draw(win, images, player_car, computer_car, game_info):
-    for img, pos in images:
-        win.blit(img, pos)
-
-    for collectible in game_info.collectibles:
-        collectible.draw(win)
-
-    level_text = MAIN_FONT.render(f"Level {game_info.level}", 1, (255, 255, 255))
-    win.blit(level_text, (10, HEIGHT - level_text.get_height() - 70))
+def line_up(computer_cars, track):
+    # The first computer car starts at its usual spot beside the player; the
+    # others take the track's grid slots behind the finish line.
+    for car, (x, y, heading, i) in zip(computer_cars[1:], track.spawns):
+        car.x = x - car.half_width
+        car.y = y - car.half_height
+        car.angle = heading
+        car.current_point = i
+        car.on_grid = True
 
-    time_text = MAIN_FONT.render(f"Time: {game_info.get_level_time()}s", 1, (255, 255, 255))
-    win.blit(time_text, (10, HEIGHT - time_text.get_height() - 40))
 
-    vel_text = MAIN_FONT.render(f"Vel: {round(player_car.vel, 1)}px/s", 1, (255, 255, 255))
-    win.blit(vel_text, (10, HEIGHT - vel_text.get_height() - 10))
+def draw(renderer, player_car, computer_cars, game_info, profiler=None):
+    renderer.begin_frame()
+    height = renderer.win.get_height()
 
-    multiplier_text = MAIN_FONT.render(f"Speed: x{round(player_car.speed_multiplier, 1)}", 1, (255, 255, 255))
-    win.blit(multiplier_text, (10, HEIGHT - multiplier_text.get_height() - 100))
+    for collectible in game_info.collectibles:
+        collectible.draw(renderer)
 
-    player_car.draw(win)
-    computer_car.draw(win)
-    pygame.display.update()
+    level_text = HUD.render(f"Level {game_info.level}")
+    renderer.blit(level_text, (10, height - level_text.get_height() - 70))
 
+    time_text = HUD.render(f"Time: {game_info.get_level_time()}s")
+    renderer.blit(time_text, (10, height - time_text.get_height() - 40))
 
-def move_player(player_car):
-    keys = pygame.key.get_pressed()
-    moved = False
+    vel_text = HUD.render(f"Vel: {round(player_car.vel, 1)}px/s")
+    renderer.blit(vel_text, (10, height - vel_text.get_height() - 10))
 
-    if keys[pygame.K_a]:
-        player_car.rotate(left=True)
-    if keys[pygame.K_d]:
-        player_car.rotate(right=True)
-    if keys[pygame.K_w]:
-        moved = True
-        player_car.move_forward()
-    if keys[pygame.K_s]:
-        moved = True
-        player_car.move_backward()
+    multiplier_text = HUD.render(f"Speed: x{round(player_car.speed_multiplier, 1)}")
+    renderer.blit(multiplier_text, (10, height - multiplier_text.get_height() - 100))
 
-    if not moved:
-        player_car.reduce_speed()
+    if game_info.lap_times:
+        lap_text = HUD.render(f"Last lap: {game_info.lap_times[-1] / 1000:.3f}s")
+        renderer.blit(lap_text, (10, height - lap_text.get_height() - 130))
 
+    player_car.draw(renderer)
+    for computer_car in computer_cars:
+        computer_car.draw(renderer)
+    if profiler:
+        profiler.draw_overlay(renderer)
+    renderer.end_frame()
 
-def handle_collision(player_car, computer_car, game_info):
-    if player_car.collide(TRACK_BORDER_MASK) != None:
-        player_car.bounce()
 
-    computer_finish_poi_collide = computer_car.collide(FINISH_MASK, *FINISH_POSITION)
-    if computer_finish_poi_collide != None:
-        return end_game_screen("You Lost!", WIN, MAIN_FONT, game_info, player_car, computer_car)  # Show end game screen and return action
+def handle_collision(player_car, computer_cars, game_info, track):
+    half_lap = len(track.racing_line) // 2
+    for computer_car in computer_cars:
+        computer_finish_poi_collide = computer_car.collide(track.finish_mask, *track.finish_position)
+        if computer_finish_poi_collide != None:
+            if not computer_car.on_grid:
+                return "lost"
+        elif computer_car.on_grid and computer_car.current_point < half_lap:
+            # Across the finish line from the grid and on its lap.
+            computer_car.on_grid = False
 
-    player_finish_poi_collide = player_car.collide(FINISH_MASK, *FINISH_POSITION)
+    player_finish_poi_collide = player_car.collide(track.finish_mask, *track.finish_position)
     if player_finish_poi_collide != None:
         if player_finish_poi_collide[1] == 0:
             player_car.bounce()
         else:
             game_info.next_level()
             player_car.reset()
-            computer_car.next_level(game_info.level)
-            return "continue"
+            for computer_car in computer_cars:
+                computer_car.next_level(game_info.level)
+            line_up(computer_cars, track)
+            return "next_level"
+
+
+def handle_collectibles(player_car, computer_cars, game_info, batch=None):
+    pick_up_collectibles((player_car, *computer_cars), game_info, batch)
+
+
+def pick_up_collectibles(cars, game_info, batch=None):
+    # Returns the (car, collectible) pairs picked up this tick. The effects
+    # of cars in batch run out in one vectorized pass.
+    current_time = game_info.clock.time()
+    if batch is not None:
+        batch.update_speed_effects(current_time)
+    for car in cars:
+        if batch is None or getattr(car, "_batch", None) is not batch:
+            car.update_speed_effects(current_time)
+
+    picked = []
+    grid = game_info.collectible_grid
+    for car in cars:
+        car_rect = collect_rect(car)
+        for collectible in grid.query(car_rect):
+            if collectible.collect(car, car_rect):
+                car.apply_speed_effect(collectible.speed_multiplier, collectible.effect_duration, current_time)
+                grid.remove(collectible)
+                picked.append((car, collectible))
+    return picked
+
+
+class Race(Simulation):
+    # Named explicitly: run as a script, the module is called __main__.
+    MODE = "vs_computer"
+    END_OUTCOMES = ("lost", "won")
+    PHASES = ("move_player", "computer_move", "collide_cars", "handle_collectibles", "handle_collision")
+
+    def __init__(self, seed=None, opponents=1, track=None):
+        super().__init__(FPS)
+        if not 1 <= opponents <= MAX_OPPONENTS:
+            raise ValueError(f"a race has 1 to {MAX_OPPONENTS} computer cars, not {opponents}")
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.track = track = track or get_track()
+        self.player_car = PlayerCar(4, 4, track.starts[0])
+
+        # Every opponent after the first gets its own line and speed.
+        rng = random.Random(seed)
+        self.computer_cars = [ComputerCar(2, 4, track.starts[1], track.racing_line)]
+        for _ in range(opponents - 1):
+            self.computer_cars.append(ComputerCar(2 * rng.uniform(0.8, 1.05), 4, track.starts[1], track.racing_line,
+                                                  lateral_offset=rng.uniform(-10, 10), cornering=rng.uniform(0.8, 1.0)))
+        line_up(self.computer_cars, track)
+        self.computer_car = self.computer_cars[0]
+        self.cars = (self.player_car, *self.computer_cars)
+        self.game_info = GameInfo(clock=self.clock, seed=seed, path=track.path)
+
+        # A field of opponents steers in one vectorized pass.
+        self.batch = None
+        if opponents > 1:
+            self.batch = CarBatch(opponents)
+            for computer_car in self.computer_cars:
+                self.batch.add(computer_car)
+
+    def update(self, player_input=0):
+        if not self.game_info.started:
+            self.game_info.start_level()
+
+        profiler = self.profiler
+        start_x, start_y, start_angle = self.player_car.x, self.player_car.y, self.player_car.angle
+        drive(self.player_car, player_input)
+        collide_wall(self.player_car, self.track.border_field, start_x, start_y, start_angle)
+        if profiler:
+            profiler.mark("move_player")
+        if self.batch is not None:
+            self.batch.follow_line(self.track.racing_line)
+        else:
+            self.computer_car.move()
+        if profiler:
+            profiler.mark("computer_move")
 
+        collide_cars(self.cars)
+        if profiler:
+            profiler.mark("collide_cars")
 
-def handle_collectibles(player_car, computer_car, game_info):
-    current_time = time.time()
-    player_car.update_speed_effects(current_time)
-    computer_car.update_speed_effects(current_time)
+        handle_collectibles(self.player_car, self.computer_cars, self.game_info, self.batch)
+        if profiler:
+            profiler.mark("handle_collectibles")
+        outcome = handle_collision(self.player_car, self.computer_cars, self.game_info, self.track)
+        if profiler:
+            profiler.mark("handle_collision")
+        if self.game_info.game_finished():
+            return "won"
+        return outcome
 
-    for collectible in game_info.collectibles:
-        if collectible.collect(player_car):
-            player_car.apply_speed_effect(collectible.speed_multiplier, collectible.effect_duration)
-        if collectible.collect(computer_car):
-            computer_car.apply_speed_effect(collectible.speed_multiplier, collectible.effect_duration)
-
-
-def end_game_screen(message, win, font, game_info, player_car, computer_car):
-    win.fill((0, 0, 0))
-
-    text = font.render(message, True, (255, 255, 255))
-    text_rect = text.get_rect(center=(WIDTH // 2, HEIGHT // 4))
-    win.blit(text, text_rect)
-
-    button_width, button_height = 200, 50
-    button_x = WIDTH // 2 - button_width // 2
-
-    restart_button = Button(button_x, HEIGHT // 2 - 60, button_width, button_height, "Restart")
-    game_menu_button = Button(button_x, HEIGHT // 2, button_width, button_height, "Game Menu")
-    quit_button = Button(button_x, HEIGHT // 2 + 60, button_width, button_height, "Quit")
-
-    restart_button.draw(win)
-    game_menu_button.draw(win)
-    quit_button.draw(win)
-
-    pygame.display.update()
-
-    waiting = True
-    while waiting:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                return "quit"
-
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_pos = event.pos
-                if restart_button.is_clicked(mouse_pos):
-                    game_info.reset()
-                    player_car.reset()
-                    computer_car.reset()
-                    return "restart"
-
-                elif quit_button.is_clicked(mouse_pos):
-
-                    pygame.quit()
-                    return "quit"
-                elif game_menu_button.is_clicked(mouse_pos):
-                    game_selection_menu.main()
-
-
-def run():
-    pygame.init()
-    WIN = pygame.display.set_mode((WIDTH, HEIGHT))
-    pygame.display.set_caption("Racing Game - VS Computer")
-
-    clock = pygame.time.Clock()
-    images = [(GRASS, (0, 0)), (TRACK, (0, 0)), (FINISH, FINISH_POSITION), (TRACK_BORDER, (0, 0))]
-    player_car = PlayerCar(4, 4)
-    computer_car = ComputerCar(2, 4, PATH)
-    game_info = GameInfo()
-
-    run = True
-    while run:
-        clock.tick(FPS)
-
-        draw(WIN, images, player_car, computer_car, game_info)
-
-        while not game_info.started:
-            blit_text_center(WIN, MAIN_FONT, f"Press any key to start level {game_info.level}!")
-            pygame.display.update()
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    return
-                if event.type == pygame.KEYDOWN:
-                    game_info.start_level()
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-                break
-
-        move_player(player_car)
-        computer_car.move()
-
-        handle_collectibles(player_car, computer_car, game_info)
-        result = handle_collision(player_car, computer_car, game_info)
-        if result == "quit":
-            run = False
-        elif result == "restart":
-            run = True
-            player_car = PlayerCar(4, 4)
-            computer_car = ComputerCar(2, 4, PATH)
-            game_info = GameInfo()
-
-        if game_info.game_finished():
-            end_game_screen("You Won!", WIN, MAIN_FONT, game_info, player_car, computer_car)
-            run = False
-
-    pygame.quit()
+
+class RaceScene(scenes.RaceScene):
+    caption = "Racing Game - VS Computer"
+
+    def __init__(self, opponents=1, track=None):
+        self.opponents = opponents
+        super().__init__(Race(opponents=opponents, track=track))
+
+    def draw(self, renderer, profiler=None):
+        race = self.race
+        draw(renderer, race.player_car, race.computer_cars, race.game_info, profiler)
+
+    def inputs(self, keys):
+        return (read_input(keys, PLAYER1_KEYS),)
+
+    def prompt(self):
+        return f"Press any key to start level {self.race.game_info.level}!"
+
+    def end_message(self, outcome):
+        return "You Lost!" if outcome == "lost" else "You Won!"
+
+    def restart(self):
+        return RaceScene(self.opponents, self.race.track)
+
+
+def run(opponents=1, track=DEFAULT_TRACK):
+    start = time.perf_counter()
+    manager = SceneManager("Racing Game - VS Computer", get_track(track))
+    manager.track.preload()
+    scene = RaceScene(opponents, manager.track)
+    print(f"Race ready in {time.perf_counter() - start:.2f}s")
+    manager.run(scene)
 
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    # python vs_computer.py [opponents] [track]
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1, sys.argv[2] if len(sys.argv) > 2 else DEFAULT_TRACK)
@@ -1,89 +1,86 @@
 import pygame
-import time
 import math
 import random
-from utils import scale_image, blit_rotate_center, blit_text_center
-import game_selection_menu
-
-pygame.font.init()
-
-GRASS = scale_image(pygame.image.load("imgs/grass.jpg"), 2.5)
-TRACK = scale_image(pygame.image.load("imgs/track.png"), 0.9)
-
-TRACK_BORDER = scale_image(pygame.image.load("imgs/track-border.png"), 0.9)
-TRACK_BORDER_MASK = pygame.mask.from_surface(TRACK_BORDER)
-
-FINISH = pygame.image.load("imgs/finish.png")
-FINISH_MASK = pygame.mask.from_surface(FINISH)
-FINISH_POSITION = (130, 250)
-
-RED_CAR = scale_image(pygame.image.load("imgs/red-car.png"), 0.55)
-GREEN_CAR = scale_image(pygame.image.load("imgs/green-car.png"), 0.55)
-WHITE_CAR = scale_image(pygame.image.load("imgs/white-car.png"), 0.55)
-
-WIDTH, HEIGHT = TRACK.get_width(), TRACK.get_height()
-WIN = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("Racing Game!")
-
-MAIN_FONT = pygame.font.SysFont("comicsans", 44)
-
+import sys
+import time
+from assets import load_image, load_rotations
+from hud import Hud
+from track import DEFAULT_TRACK, get_track
+from spatial import UniformGrid
+from collision import collide_cars, collide_wall, wall_capsule
+from simulation import Simulation, TickClock, PLAYER1_KEYS, PLAYER2_KEYS, read_input, drive
+import scenes
+from scenes import SceneManager
+
+CAR_SCALE = 0.55
+RED_CAR = "imgs/red-car.png"
+GREEN_CAR = "imgs/green-car.png"
+WHITE_CAR = "imgs/white-car.png"
+BOOST_IMG = "imgs/booster-green.svg"
+SLOWER_IMG = "imgs/slower.png"
+
+HUD = Hud("comicsans", 44)
+
+# Simulation ticks per second. Speeds are in pixels per tick, and frames are
+# drawn at their own rate in between.
 FPS = 60
-PATH = [(175, 119), (110, 70),
-        (56, 133), (70, 481), (318, 731), (404, 680), (418, 521), (507, 475), (600, 551), (613, 715), (736, 713),
-        (734, 399), (611, 357), (409, 343), (433, 257), (697, 258), (738, 123), (581, 71), (303, 78), (275, 377),
-        (176, 388), (178, 260)
-        ]
 
 
 class GameInfo:
     LEVELS = 10
+    COLLECTIBLES = 6
 
-    def __init__(self, level=1):
+    def __init__(self, level=1, clock=None, seed=None, path=None):
+        self.clock = clock or TickClock(FPS)
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        # The track's waypoints collectibles are placed on.
+        self.path = get_track().path if path is None else path
         self.level = level
         self.started = False
-        self.level_start_time = 0
-
-        random_positions = random.sample(PATH, 6)
-
-        self.collectibles = [
-            Collectible(random_positions[0][0], random_positions[0][1], True),  # Boost
-            Collectible(random_positions[1][0], random_positions[1][1], False),  # Slower
-            Collectible(random_positions[2][0], random_positions[2][1], True),  # Boost
-            Collectible(random_positions[3][0], random_positions[3][1], False),  # Slower
-            Collectible(random_positions[4][0], random_positions[4][1], True),  # Boost
-            Collectible(random_positions[5][0], random_positions[5][1], False)  # Slower
-        ]
+        self.level_start_tick = 0
+        self.spawn_collectibles()
 
     def reset(self):
         self.level = 1
         self.started = False
-        self.level_start_time = 0
-
-        random_positions = random.sample(PATH, 6)
-        self.collectibles = [
-            Collectible(random_positions[0][0], random_positions[0][1], True),  # Boost
-            Collectible(random_positions[1][0], random_positions[1][1], False),  # Slower
-            Collectible(random_positions[2][0], random_positions[2][1], True),  # Boost
-            Collectible(random_positions[3][0], random_positions[3][1], False),  # Slower
-            Collectible(random_positions[4][0], random_positions[4][1], True),  # Boost
-            Collectible(random_positions[5][0], random_positions[5][1], False)  # Slower
-        ]
+        self.level_start_tick = 0
+        self.spawn_collectibles()
 
     def next_level(self):
         self.level += 1
         self.started = False
 
+    def spawn_collectibles(self):
+        # Boosts and slowers alternate. The layout only depends on the seed and
+        # the level, so a restored snapshot can rebuild it.
+        rng = random.Random(self.seed * (self.LEVELS + 1) + self.level)
+        random_positions = rng.sample(self.path, self.COLLECTIBLES)
+        self.collectibles = [Collectible(x, y, i % 2 == 0) for i, (x, y) in enumerate(random_positions)]
+        self.collectible_grid = UniformGrid()
+        for collectible in self.collectibles:
+            self.collectible_grid.insert(collectible, collectible.rect)
+
     def game_finished(self):
         return self.level > self.LEVELS
 
     def start_level(self):
         self.started = True
-        self.level_start_time = time.time()
+        self.level_start_tick = self.clock.ticks
 
     def get_level_time(self):
+        return round(self.get_level_time_ms() / 1000)
+
+    def get_level_time_ms(self):
         if not self.started:
             return 0
-        return round(time.time() - self.level_start_time)
+        return self.clock.ticks_to_ms(self.clock.ticks - self.level_start_tick)
+
+
+def collect_rect(car):
+    return pygame.Rect(car.x - car.img.get_width() / 2,
+                       car.y - car.img.get_height() / 2,
+                       car.img.get_width(),
+                       car.img.get_height())
 
 
 class Collectible:
@@ -95,38 +92,34 @@ class Collectible:
         self.radius = 15
         self.effect_duration = 3
         self.speed_multiplier = 2.0 if is_boost else 0.5
+        self.img_path = BOOST_IMG if is_boost else SLOWER_IMG
+        self.rect = pygame.Rect(x - self.radius, y - self.radius, self.radius * 2, self.radius * 2)
 
-    def collect(self, car):
+    def collect(self, car, car_rect=None):
         if not self.collected:
-            car_rect = pygame.Rect(car.x - car.img.get_width() / 2,
-                                   car.y - car.img.get_height() / 2,
-                                   car.img.get_width(),
-                                   car.img.get_height())
-            collectible_rect = pygame.Rect(self.x - self.radius,
-                                           self.y - self.radius,
-                                           self.radius * 2,
-                                           self.radius * 2)
-            if car_rect.colliderect(collectible_rect):
+            if car_rect is None:
+                car_rect = collect_rect(car)
+            if car_rect.colliderect(self.rect):
                 self.collected = True
                 return True
         return False
 
     def draw(self, win):
         if not self.collected:
-            img_path = "imgs/booster-green.svg" if self.is_boost else "imgs/slower.png"
-            image = pygame.image.load(img_path)
-            win.blit(image, (self.x, self.y))
+            win.blit(load_image(self.img_path), (self.x, self.y))
 
 
 class AbstractCar:
-    def __init__(self, max_vel, rotation_vel):
-        self.img = self.IMG
+    def __init__(self, max_vel, rotation_vel, start_pos):
+        self.img = load_image(self.IMG, CAR_SCALE)
+        self.rotations = load_rotations(self.IMG, CAR_SCALE)
         self.max_vel = max_vel
         self.base_max_vel = max_vel
         self.vel = 0
         self.rotation_vel = rotation_vel
         self.angle = 0
-        self.x, self.y = self.START_POS
+        self.start_pos = start_pos
+        self.x, self.y = start_pos
         self.acceleration = 0.1
         self.base_max_vel = max_vel
         self.rect = self.img.get_rect(center=(self.x, self.y))
@@ -135,10 +128,10 @@ class AbstractCar:
         self.speed_multiplier = 1.0
         self.effect_end_time = 0
 
-    def apply_speed_effect(self, multiplier, duration):
+    def apply_speed_effect(self, multiplier, duration, current_time):
         self.speed_multiplier = multiplier
         self.max_vel = self.base_max_vel * multiplier
-        self.effect_end_time = time.time() + duration
+        self.effect_end_time = current_time + duration
 
     def update_speed_effects(self, current_time):
         if current_time > self.effect_end_time:
@@ -152,7 +145,8 @@ class AbstractCar:
             self.angle -= self.rotation_vel
 
     def draw(self, win):
-        blit_rotate_center(win, self.img, (self.x, self.y), self.angle)
+        image, offset, _ = self.rotations.get(self.angle)
+        win.blit(image, (self.x + offset[0], self.y + offset[1]))
 
     def move_forward(self):
         self.vel = min(self.vel + self.acceleration, self.max_vel)
@@ -179,14 +173,18 @@ class AbstractCar:
         self.x, self.y = self.previous_pos
         self.rect.center = (self.x, self.y)
 
+    def hits_wall(self, field):
+        # The car is treated as a capsule along its heading, as wide as the car.
+        return field.hits_capsule(*wall_capsule(self, self.x, self.y))
+
     def collide(self, mask, x=0, y=0):
-        car_mask = pygame.mask.from_surface(self.img)
-        offset = (int(self.x - x), int(self.y - y))
+        _, offset, car_mask = self.rotations.get(self.angle)
+        offset = (int(self.x + offset[0] - x), int(self.y + offset[1] - y))
         poi = mask.overlap(car_mask, offset)
         return poi
 
     def reset(self):
-        self.x, self.y = self.START_POS
+        self.x, self.y = self.start_pos
         self.angle = 0
         self.vel = 0
         self.max_vel = self.base_max_vel
@@ -195,7 +193,6 @@ class AbstractCar:
 
 class PlayerCar1(AbstractCar):
     IMG = RED_CAR
-    START_POS = (180, 200)
 
     def reduce_speed(self):
         self.vel = max(self.vel - self.acceleration / 2, 0)
@@ -208,7 +205,6 @@ class PlayerCar1(AbstractCar):
 
 class PlayerCar2(AbstractCar):
     IMG = WHITE_CAR
-    START_POS = (150, 200)
 
     def reduce_speed(self):
         self.vel = max(self.vel - self.acceleration / 2, 0)
@@ -219,221 +215,129 @@ class PlayerCar2(AbstractCar):
         self.move()
 
 
-class Button:
-    def __init__(self, x, y, width, height, text, color=(100, 100, 100)):
-        self.rect = pygame.Rect(x, y, width, height)
-        self.text = text
-        self.color = color
-        self.font = pygame.font.SysFont("comicsans", 30)
-
-    def draw(self, win):
-        pygame.draw.rect(win, self.color, self.rect)
-        text_surface = self.font.render(self.text, True, (255, 255, 255))
-        text_rect = text_surface.get_rect(center=self.rect.center)
-        win.blit(text_surface, text_rect)
-
-    def is_clicked(self, pos):
-        return self.rect.collidepoint(pos)
+def draw(renderer, player1, player2, game_info, profiler=None):
+    renderer.begin_frame()
+    height = renderer.win.get_height()
 
+    for collectible in game_info.collectibles:
+        collectible.draw(renderer)
 
-def draw(win, images, player1, player2, game_info):
-    for img, pos in images:
-        win.blit(img, pos)
+    time_text = HUD.render(f"Time: {game_info.get_level_time()}s")
+    renderer.blit(time_text, (10, height - time_text.get_height() - 110))
 
-    for collectible in game_info.collectibles:
-        collectible.draw(win)
-
-    time_text = MAIN_FONT.render(
-        f"Time: {game_info.get_level_time()}s", 1, (255, 255, 255))
-    win.blit(time_text, (10, HEIGHT - time_text.get_height() - 110))
-
-    vel_text = MAIN_FONT.render(
-        f"Player1: {round(player1.vel, 1)}px/s", 1, (255, 255, 255))
-    win.blit(vel_text, (10, HEIGHT - vel_text.get_height() - 60))
-    vel_text = MAIN_FONT.render(
-        f"Player2: {round(player2.vel, 1)}px/s", 1, (255, 255, 255))
-    win.blit(vel_text, (10, HEIGHT - vel_text.get_height() - 10))
-
-    player1.draw(win)
-    player2.draw(win)
-    pygame.display.update()
-
-
-def move_player(player1, player2):
-    keys = pygame.key.get_pressed()
-    moved_player1 = False
-    moved_player2 = False
-
-    # Player 1 Movement
-    if keys[pygame.K_a]:
-        player1.rotate(left=True)
-    if keys[pygame.K_d]:
-        player1.rotate(right=True)
-    if keys[pygame.K_w]:
-        moved_player1 = True
-        player1.move_forward()
-    if keys[pygame.K_s]:
-        moved_player1 = True
-        player1.move_backward()
-
-    # Player 2 Movement
-    if keys[pygame.K_LEFT]:
-        player2.rotate(left=True)
-    if keys[pygame.K_RIGHT]:
-        player2.rotate(right=True)
-    if keys[pygame.K_UP]:
-        moved_player2 = True
-        player2.move_forward()
-    if keys[pygame.K_DOWN]:
-        moved_player2 = True
-        player2.move_backward()
-
-    if not moved_player1:
-        player1.reduce_speed()
-    if not moved_player2:
-        player2.reduce_speed()
+    vel_text = HUD.render(f"Player1: {round(player1.vel, 1)}px/s")
+    renderer.blit(vel_text, (10, height - vel_text.get_height() - 60))
+    vel_text = HUD.render(f"Player2: {round(player2.vel, 1)}px/s")
+    renderer.blit(vel_text, (10, height - vel_text.get_height() - 10))
 
+    player1.draw(renderer)
+    player2.draw(renderer)
+    if profiler:
+        profiler.draw_overlay(renderer)
+    renderer.end_frame()
 
 
 def handle_collectibles(player1, player2, game_info):
-    current_time = time.time()
+    current_time = game_info.clock.time()
     player1.update_speed_effects(current_time)
     player2.update_speed_effects(current_time)
 
-    for collectible in game_info.collectibles:
-        if collectible.collect(player1):
-            player1.apply_speed_effect(collectible.speed_multiplier, collectible.effect_duration)
-        if collectible.collect(player2):
-            player2.apply_speed_effect(collectible.speed_multiplier, collectible.effect_duration)
-
+    grid = game_info.collectible_grid
+    for car in (player1, player2):
+        car_rect = collect_rect(car)
+        for collectible in grid.query(car_rect):
+            if collectible.collect(car, car_rect):
+                car.apply_speed_effect(collectible.speed_multiplier, collectible.effect_duration, current_time)
+                grid.remove(collectible)
 
-def handle_collision(player1, player2, game_info):
-    if player1.collide(TRACK_BORDER_MASK) is not None:
-        player1.bounce()
-    if player2.collide(TRACK_BORDER_MASK) is not None:
-        player2.bounce()
 
-    player1_finish_poi_collide = player1.collide(FINISH_MASK, *FINISH_POSITION)
+def handle_collision(player1, player2, game_info, track):
+    player1_finish_poi_collide = player1.collide(track.finish_mask, *track.finish_position)
     if player1_finish_poi_collide is not None:
         if player1_finish_poi_collide[1] == 0:
             player1.bounce()
         else:
-            return show_end_game_screen(WIN, "Player 1", game_info, player1, player2)
+            return "player1_won"
 
-    player2_finish_poi_collide = player2.collide(FINISH_MASK, *FINISH_POSITION)
+    player2_finish_poi_collide = player2.collide(track.finish_mask, *track.finish_position)
     if player2_finish_poi_collide is not None:
         if player2_finish_poi_collide[1] == 0:
             player2.bounce()
         else:
-            return show_end_game_screen(WIN, "Player 2", game_info, player1, player2)
-    return "continue"
-
-
-
-def show_end_game_screen(win, winner, game_info, player1=None, player2=None, player_car=None, computer_car=None):
-    win.fill((0, 0, 0))
-
-    button_width, button_height = 200, 50
-    button_x = WIDTH // 2 - button_width // 2
-
-    restart_button = Button(button_x, HEIGHT // 2 - 60, button_width, button_height, "Restart")
-    game_selection_button = Button(button_x, HEIGHT // 2, button_width, button_height, "Game Menu")
-    quit_button = Button(button_x, HEIGHT // 2 + 60, button_width, button_height, "Quit")
-
-    winner_text = MAIN_FONT.render(f"{winner} Won!", 1, (255, 255, 255))
-    win.blit(winner_text, (WIDTH // 2 - winner_text.get_width() // 2, HEIGHT // 2 - 200))
-
-    restart_button.draw(win)
-    game_selection_button.draw(win)
-    quit_button.draw(win)
-
-    pygame.display.update()
-
-    while True:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                return "quit"
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_pos = pygame.mouse.get_pos()
-                if restart_button.is_clicked(mouse_pos):
-                        game_info.reset()
-                        if player1 and player2:
-                            player1.reset()
-                            player2.reset()
-                        elif player_car and computer_car:
-                            player_car.reset()
-                            computer_car.reset()
-                        return "restart"
-
-                elif quit_button.is_clicked(mouse_pos):
-                    pygame.quit()
-                    return "quit"
-                elif game_selection_button.is_clicked(mouse_pos):
-                    game_selection_menu.main()
-
-
-
-def run():
-    run = True
-    clock = pygame.time.Clock()
-    images = [(GRASS, (0, 0)), (TRACK, (0, 0)),
-              (FINISH, FINISH_POSITION), (TRACK_BORDER, (0, 0))]
-
-    game_info = GameInfo()
-
-    player1 = PlayerCar1(4, 4)
-    player2 = PlayerCar2(4, 4)
-
-    while run:
-        clock.tick(FPS)
-        draw(WIN, images, player1, player2, game_info)
-
-        while not game_info.started:
-            blit_text_center(
-                WIN, MAIN_FONT, f"Press any key to start the race!")
-            pygame.display.update()
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    return
-                if event.type == pygame.KEYDOWN:
-                    game_info.start_level()
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-                break
-
-        move_player(player1, player2)
-
-        handle_collectibles(player1, player2, game_info)
-
-        result = handle_collision(player1, player2, game_info)
-        if result == "quit":
-            run = False
-        elif result == "restart":
-            game_info = GameInfo()
-            player1 = PlayerCar1(4, 4)
-            player2 = PlayerCar2(4, 4)
-        elif result == "game_selection":
-            return "game_selection"
-
-
-        if game_info.game_finished():
-             result = show_end_game_screen(WIN, "No One", game_info, player1, player2)
-             if result == "quit":
-                 run = False
-             elif result == "restart":
-                 game_info = GameInfo()
-                 player1 = PlayerCar1(4, 4)
-                 player2 = PlayerCar2(4, 4)
-             elif result == "game_selection":
-                 return "game_selection"
-
-
-    pygame.quit()
+            return "player2_won"
+
+
+class Race(Simulation):
+    # Named explicitly: run as a script, the module is called __main__.
+    MODE = "vs_multiplayer"
+    END_OUTCOMES = ("player1_won", "player2_won", "finished")
+    PHASES = ("move_player", "collide_cars", "handle_collectibles", "handle_collision")
+
+    def __init__(self, seed=None, track=None):
+        super().__init__(FPS)
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        self.track = track = track or get_track()
+        self.player1 = PlayerCar1(4, 4, track.starts[0])
+        self.player2 = PlayerCar2(4, 4, track.starts[1])
+        self.cars = (self.player1, self.player2)
+        self.game_info = GameInfo(clock=self.clock, seed=seed, path=track.path)
+
+    def update(self, player1_input=0, player2_input=0):
+        if not self.game_info.started:
+            self.game_info.start_level()
+
+        profiler = self.profiler
+        for car, bits in ((self.player1, player1_input), (self.player2, player2_input)):
+            start_x, start_y, start_angle = car.x, car.y, car.angle
+            drive(car, bits)
+            collide_wall(car, self.track.border_field, start_x, start_y, start_angle)
+        if profiler:
+            profiler.mark("move_player")
+
+        collide_cars(self.cars)
+        if profiler:
+            profiler.mark("collide_cars")
+
+        handle_collectibles(self.player1, self.player2, self.game_info)
+        if profiler:
+            profiler.mark("handle_collectibles")
+        outcome = handle_collision(self.player1, self.player2, self.game_info, self.track)
+        if profiler:
+            profiler.mark("handle_collision")
+        if self.game_info.game_finished():
+            return "finished"
+        return outcome
+
+
+class RaceScene(scenes.RaceScene):
+    def __init__(self, track=None):
+        super().__init__(Race(track=track))
+
+    def draw(self, renderer, profiler=None):
+        draw(renderer, *self.race.cars, self.race.game_info, profiler)
+
+    def inputs(self, keys):
+        return read_input(keys, PLAYER1_KEYS), read_input(keys, PLAYER2_KEYS)
+
+    def end_message(self, outcome):
+        winner = {"player1_won": "Player 1", "player2_won": "Player 2"}.get(outcome, "No One")
+        return f"{winner} Won!"
+
+    def restart(self):
+        return RaceScene(self.race.track)
+
+
+def run(track=DEFAULT_TRACK):
+    start = time.perf_counter()
+    manager = SceneManager(track=get_track(track))
+    manager.track.preload()
+    scene = RaceScene(manager.track)
+    print(f"Race ready in {time.perf_counter() - start:.2f}s")
+    manager.run(scene)
 
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    # python vs_multiplayer.py [track]
+    run(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TRACK)